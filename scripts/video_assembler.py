@@ -3,33 +3,268 @@ Video Assembly Module
 Creates lyric videos with visualizations using FFmpeg
 """
 
+import hashlib
 import os
+import shutil
 import subprocess
+import tempfile
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Optional
 import textwrap
 
+import numpy as np
+
+# Hardware H.264 encoders in preference order, with speed-oriented options
+HW_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4"],
+    "h264_videotoolbox": ["-realtime", "1"],
+    "h264_qsv": ["-preset", "veryfast"],
+}
+
+
+# Backgrounds are smooth gradients: render them small and let FFmpeg upscale,
+# which keeps the raw frame pipe ~100x narrower than full 1080p
+GRADIENT_SIZE = (192, 108)
+GRADIENT_PERIOD = 8.0  # seconds per colour-drift cycle
+
+
+def _hex_to_rgb(color: str) -> np.ndarray:
+    """Convert #RRGGBB to a float RGB array"""
+    return np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.float32)
+
+
+@lru_cache(maxsize=64)
+def _hex_to_ass(color: str) -> str:
+    """Convert #RRGGBB to ASS BBGGRR by swapping the red and blue bytes"""
+    try:
+        n = int(color[1:], 16)
+    except ValueError:
+        return "FFFFFF"
+    return f"{((n & 0xFF) << 16) | (n & 0xFF00) | ((n >> 16) & 0xFF):06X}"
+
+
+# Burned-in lyric style; path must already be escaped for the filtergraph
+SUBTITLES_FILTER = (
+    "subtitles={path}:force_style='FontSize={font_size},"
+    "PrimaryColour=&H{color},Alignment=2,MarginV=100'"
+)
+
+
+@lru_cache(maxsize=32)
+def _escape_filter_path(path: str) -> str:
+    """
+    Escape a file path for use as an FFmpeg filter option value
+    
+    Backslashes become forward slashes (Windows), and characters that the
+    filtergraph parser treats as separators (':' in C:/..., ',', ';', '[', ']')
+    are backslash-escaped so they stay part of the path.
+    """
+    path = path.replace("\\", "/")
+    for ch in ":,;[]":
+        path = path.replace(ch, "\\" + ch)
+    return path
+
+
+# Resolved once per process
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+# Errors only: no banner, progress stats or per-stream info on stderr
+FFMPEG_QUIET = ["-hide_banner", "-loglevel", "error", "-nostats"]
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg_available() -> bool:
+    """Check (once) that FFmpeg is on PATH and runs"""
+    if FFMPEG_PATH is None:
+        return False
+    try:
+        subprocess.run(
+            [FFMPEG_PATH, "-version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+
+def _probe_encoder(encoder: str) -> bool:
+    """Encode a single tiny frame to check the encoder has a usable device"""
+    try:
+        subprocess.run(
+            [FFMPEG_PATH, *FFMPEG_QUIET,
+             "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+             "-frames:v", "1", "-c:v", encoder, *HW_ENCODERS[encoder],
+             "-f", "null", "-"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=15
+        )
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+
+@lru_cache(maxsize=1)
+def _detect_hw_encoder() -> Optional[str]:
+    """
+    Return the first hardware H.264 encoder that actually works, if any
+    
+    `ffmpeg -encoders` lists everything the build was compiled with (nvenc,
+    qsv, ...) even without a GPU/driver, so each candidate is probe-encoded.
+    """
+    if FFMPEG_PATH is None:
+        return None
+    try:
+        result = subprocess.run(
+            [FFMPEG_PATH, "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    available = {line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 1}
+    return next((enc for enc in HW_ENCODERS if enc in available and _probe_encoder(enc)), None)
+
+
 class VideoAssembler:
+    # Genre-based color schemes (lyric video gradient start/end)
+    COLOR_SCHEMES = {
+        "lo-fi": ("#8B5CF6", "#EC4899"),  # Purple to pink
+        "edm": ("#3B82F6", "#8B5CF6"),     # Blue to purple
+        "pop": ("#EC4899", "#F59E0B"),     # Pink to orange
+        "classical": ("#1F2937", "#4B5563"), # Dark gray tones
+        "jazz": ("#92400E", "#B45309"),    # Brown tones
+        "ambient": ("#1E293B", "#334155")  # Dark blue-gray
+    }
+    
+    # Genre colors for lyric cards
+    CARD_COLOR_SCHEMES = {
+        "lo-fi": "#8B5CF6",
+        "edm": "#3B82F6",
+        "pop": "#EC4899",
+        "classical": "#4B5563",
+        "jazz": "#B45309",
+        "ambient": "#334155"
+    }
+    
+    # Named colors in ASS (BBGGRR) order
+    ASS_COLOR_MAP = {
+        "white": "FFFFFF",
+        "black": "000000",
+        "red": "0000FF",
+        "green": "00FF00",
+        "blue": "FF0000",
+        "yellow": "00FFFF",
+        "purple": "FF00FF",
+        "pink": "CBC0FF"
+    }
+    
     def __init__(self, output_dir: str = "./video_output"):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.width = 1920
         self.height = 1080
         self.fps = 30
+        self.vcodec = _detect_hw_encoder() or "libx264"
+        
+    def _video_codec_args(self, x264_preset: str = "veryfast", codec: Optional[str] = None) -> List[str]:
+        """Encoder arguments for codec (default: the selected codec)"""
+        codec = codec or self.vcodec
+        if codec == "libx264":
+            return ["-c:v", "libx264", "-preset", x264_preset]
+        return ["-c:v", codec, *HW_ENCODERS[codec]]
+    
+    def _encode(self, build_cmd, x264_preset: str = "veryfast", frames=None) -> str:
+        """
+        Run an FFmpeg encode built from the codec arguments
         
-    def check_ffmpeg(self) -> bool:
-        """Check if FFmpeg is installed"""
+        frames, if given, is a callable returning an iterator of raw RGB frames
+        to stream into FFmpeg's stdin. Falls back to libx264 (for this and
+        later encodes) if the hardware encoder fails. Returns the codec used.
+        """
+        # Read once: parallel encodes may switch self.vcodec underneath us
+        codec = self.vcodec
         try:
-            subprocess.run(
-                ["ffmpeg", "-version"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True
-            )
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+            self._run_ffmpeg(build_cmd(self._video_codec_args(x264_preset, codec)), frames)
+            return codec
+        except subprocess.CalledProcessError:
+            if codec == "libx264":
+                raise
+            print(f"{codec} encode failed, falling back to libx264")
+            self.vcodec = "libx264"
+            self._run_ffmpeg(build_cmd(self._video_codec_args(x264_preset, "libx264")), frames)
+            return "libx264"
+    
+    def _run_ffmpeg(self, cmd: List[str], frames=None):
+        """
+        Run FFmpeg, optionally piping raw frames to stdin
+        
+        Progress and banner output are suppressed, so stderr only carries
+        errors; it is attached to the CalledProcessError raised on failure.
+        """
+        cmd = [cmd[0], *FFMPEG_QUIET, *cmd[1:]]
+        if frames is None:
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            _, err = proc.communicate()
+            if proc.returncode:
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err)
+            return
+        
+        # stderr goes to a file so FFmpeg can't block on a full pipe while we write
+        with tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err)
+            try:
+                for frame in frames():
+                    proc.stdin.write(frame.tobytes())
+            except BrokenPipeError:
+                pass  # FFmpeg exited early; its return code reports why
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            if proc.wait():
+                err.seek(0)
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err.read())
+    
+    def _gradient_frames(self, colors: tuple, duration: float, start_time: float = 0.0):
+        """
+        Yield animated diagonal gradient frames (GRADIENT_SIZE, uint8 RGB)
+        
+        The blend drifts sinusoidally over GRADIENT_PERIOD seconds; start_time
+        keeps the animation continuous across separately encoded segments.
+        """
+        w, h = GRADIENT_SIZE
+        c0, c1 = _hex_to_rgb(colors[0]), _hex_to_rgb(colors[-1])
+        xs = np.linspace(0.0, 1.0, w, dtype=np.float32)[None, :]
+        ys = np.linspace(0.0, 1.0, h, dtype=np.float32)[:, None]
+        base = (0.5 * (xs + ys))[:, :, None]
+        for k in range(int(round(duration * self.fps))):
+            t = start_time + k / self.fps
+            mix = base + np.float32(0.05 * np.sin(2 * np.pi * t / GRADIENT_PERIOD))
+            yield (c0 * (1 - mix) + c1 * mix).clip(0, 255).astype(np.uint8)
+    
+    def _rawvideo_input(self) -> List[str]:
+        """FFmpeg input args for gradient frames streamed over stdin"""
+        w, h = GRADIENT_SIZE
+        return [
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{w}x{h}",
+            "-r", str(self.fps),
+            "-i", "pipe:0",
+        ]
+        
+    def check_ffmpeg(self) -> bool:
+        """Check if FFmpeg is installed (probed once per process)"""
+        return _ffmpeg_available()
     
     def create_lyric_subtitle_file(
         self,
@@ -43,25 +278,20 @@ class VideoAssembler:
         Args:
             lyrics: List of lyric lines
             duration_per_line: How long each line appears (seconds)
-            output_file: Output filename
+            output_file: Output filename (relative to output_dir) or absolute path
         
         Returns:
             Path to subtitle file
         """
         filepath = self.output_dir / output_file
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for i, line in enumerate(lyrics, 1):
-                start_time = (i - 1) * duration_per_line
-                end_time = i * duration_per_line
-                
-                # Format: HH:MM:SS,mmm
-                start_str = self._format_srt_time(start_time)
-                end_str = self._format_srt_time(end_time)
-                
-                f.write(f"{i}\n")
-                f.write(f"{start_str} --> {end_str}\n")
-                f.write(f"{line}\n\n")
+        # Line boundaries (HH:MM:SS,mmm); each is the end of one cue and the start of the next
+        times = [self._format_srt_time(i * duration_per_line) for i in range(len(lyrics) + 1)]
+        body = "".join(
+            f"{i + 1}\n{times[i]} --> {times[i + 1]}\n{line}\n\n"
+            for i, line in enumerate(lyrics)
+        )
+        filepath.write_text(body, encoding='utf-8')
         
         return str(filepath)
     
@@ -92,31 +322,19 @@ class VideoAssembler:
         """
         filepath = self.output_dir / output_file
         
-        # FFmpeg command to create gradient
-        # Using color generation with gradients
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "lavfi",
-            "-i", f"color=c={colors[0]}:s={self.width}x{self.height}:d={duration}",
-            "-vf", f"geq=r='r(X,Y)':g='g(X,Y)':b='b(X,Y)+sin(T)*50'",
-            "-c:v", "libx264",
-            "-t", str(duration),
-            "-pix_fmt", "yuv420p",
-            str(filepath)
-        ]
-        
-        # Simplified version - solid color
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "lavfi",
-            "-i", f"color=c={colors[0]}:s={self.width}x{self.height}:d={duration}:r={self.fps}",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
-            str(filepath)
-        ]
+        # Gradient frames are generated in NumPy and piped in at low resolution
+        def cmd(codec):
+            return [
+                "ffmpeg", "-y",
+                *self._rawvideo_input(),
+                "-vf", f"scale={self.width}:{self.height}",
+                *codec,
+                "-pix_fmt", "yuv420p",
+                str(filepath)
+            ]
         
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
+            self._encode(cmd, frames=lambda: self._gradient_frames(colors, duration))
             return str(filepath)
         except subprocess.CalledProcessError as e:
             print(f"Error creating background: {e.stderr.decode()}")
@@ -145,44 +363,37 @@ class VideoAssembler:
         """
         filepath = self.output_dir / output_file
         
-        # Escape the subtitle file path for FFmpeg
-        subtitle_path = str(Path(subtitle_file).absolute()).replace('\\', '/').replace(':', '\\:')
-        
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", background_video,
-            "-vf", f"subtitles={subtitle_path}:force_style='FontSize={font_size},PrimaryColour=&H{self._color_to_ass(font_color)},Alignment=2,MarginV=100'",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
-            str(filepath)
-        ]
+        def cmd(codec):
+            return [
+                "ffmpeg", "-y",
+                "-i", background_video,
+                "-vf", self._subtitles_filter(subtitle_file, font_size, font_color),
+                *codec,
+                "-pix_fmt", "yuv420p",
+                str(filepath)
+            ]
         
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
+            self._encode(cmd)
             return str(filepath)
         except subprocess.CalledProcessError as e:
             print(f"Error adding lyrics: {e.stderr.decode()}")
             raise
     
+    def _subtitles_filter(self, subtitle_file: str, font_size: int, font_color: str) -> str:
+        """Build the FFmpeg subtitles filter that burns in an SRT file"""
+        return SUBTITLES_FILTER.format(
+            path=_escape_filter_path(str(Path(subtitle_file).absolute())),
+            font_size=font_size,
+            color=self._color_to_ass(font_color),
+        )
+    
     def _color_to_ass(self, color: str) -> str:
         """Convert color name or hex to ASS format"""
-        color_map = {
-            "white": "FFFFFF",
-            "black": "000000",
-            "red": "0000FF",
-            "green": "00FF00",
-            "blue": "FF0000",
-            "yellow": "00FFFF",
-            "purple": "FF00FF",
-            "pink": "CBC0FF"
-        }
-        
-        if color.lower() in color_map:
-            return color_map[color.lower()]
+        if color.lower() in self.ASS_COLOR_MAP:
+            return self.ASS_COLOR_MAP[color.lower()]
         elif color.startswith("#"):
-            # Convert #RRGGBB to BBGGRR for ASS
-            hex_color = color[1:]
-            return hex_color[4:6] + hex_color[2:4] + hex_color[0:2]
+            return _hex_to_ass(color)
         else:
             return "FFFFFF"
     
@@ -191,7 +402,8 @@ class VideoAssembler:
         lyrics: List[str],
         duration_per_line: float = 5.0,
         genre: str = "lo-fi",
-        output_file: str = "final_video.mp4"
+        output_file: str = "final_video.mp4",
+        background_file: Optional[str] = None
     ) -> str:
         """
         Create complete lyric video
@@ -201,51 +413,133 @@ class VideoAssembler:
             duration_per_line: Duration per line in seconds
             genre: Music genre (affects color scheme)
             output_file: Output filename
+            background_file: Optional filename for a subtitle-free copy of the
+                background (for re-subbing), written from the same encode pass
         
         Returns:
             Path to final video
         """
-        # Genre-based color schemes
-        color_schemes = {
-            "lo-fi": ("#8B5CF6", "#EC4899"),  # Purple to pink
-            "edm": ("#3B82F6", "#8B5CF6"),     # Blue to purple
-            "pop": ("#EC4899", "#F59E0B"),     # Pink to orange
-            "classical": ("#1F2937", "#4B5563"), # Dark gray tones
-            "jazz": ("#92400E", "#B45309"),    # Brown tones
-            "ambient": ("#1E293B", "#334155")  # Dark blue-gray
-        }
-        
-        colors = color_schemes.get(genre.lower(), color_schemes["lo-fi"])
-        total_duration = len(lyrics) * duration_per_line
-        
-        # Step 1: Create subtitle file
-        print("Creating subtitle file...")
+        colors = self.COLOR_SCHEMES.get(genre.lower(), self.COLOR_SCHEMES["lo-fi"])
+        filepath = self.output_dir / output_file
+        bg_filepath = self.output_dir / background_file if background_file else None
+        
+        # Subtitle files and segments live in a per-render scratch directory,
+        # so concurrent renders into the same output_dir can't collide
+        with tempfile.TemporaryDirectory(dir=self.output_dir, prefix=f".{filepath.stem}_") as tmp:
+            # Absolute, so paths under it aren't re-joined onto output_dir
+            work_dir = Path(tmp).resolve()
+            
+            # Split long videos into line-aligned segments encoded in parallel
+            # (each segment is its own FFmpeg process), then join without re-encoding
+            n_segments = max(1, min((os.cpu_count() or 2) // 2, len(lyrics) // 4))
+            if n_segments == 1:
+                print("Rendering lyric video...")
+                self._encode_segment(lyrics, 0, colors, filepath, duration_per_line, bg_filepath, work_dir)
+            else:
+                per_segment = -(-len(lyrics) // n_segments)
+                starts = range(0, len(lyrics), per_segment)
+                segments = [work_dir / f"segment_{i:04d}.mp4" for i in starts]
+                bg_segments = [work_dir / f"segment_{i:04d}_bg.mp4" for i in starts] if bg_filepath else [None] * len(segments)
+                print(f"Rendering lyric video in {len(segments)} segments...")
+                with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+                    futures = [
+                        pool.submit(self._encode_segment, lyrics[i:i + per_segment], i, colors, seg, duration_per_line, bg_seg, work_dir)
+                        for i, seg, bg_seg in zip(starts, segments, bg_segments)
+                    ]
+                    codecs = {future.result() for future in futures}
+                # A segment that fell back to libx264 can't be stream-copied
+                # alongside hardware-encoded ones
+                reencode = len(codecs) > 1
+                self._concat_segments(segments, filepath, reencode)
+                if bg_filepath:
+                    self._concat_segments(bg_segments, bg_filepath, reencode)
+        
+        final_video = str(filepath)
+        print(f"Video created: {final_video}")
+        return final_video
+    
+    def _encode_segment(
+        self,
+        lyrics_chunk: List[str],
+        start_idx: int,
+        colors: tuple,
+        out_path: Path,
+        duration_per_line: float = 5.0,
+        bg_path: Optional[Path] = None,
+        work_dir: Optional[Path] = None
+    ) -> str:
+        """
+        Render one run of lyric lines: background + burned-in subtitles in a single encode
+        
+        With bg_path, the scaled background is split in the filter graph and
+        also written without subtitles, so both outputs share one pass. The
+        subtitle file goes in work_dir (default: output_dir). Returns the codec used.
+        """
         subtitle_file = self.create_lyric_subtitle_file(
-            lyrics,
+            lyrics_chunk,
             duration_per_line,
-            "lyrics.srt"
+            str(work_dir / f"lyrics_{start_idx:04d}.srt") if work_dir else f"lyrics_{start_idx:04d}.srt"
         )
+        duration = len(lyrics_chunk) * duration_per_line
+        start_time = start_idx * duration_per_line
+        subtitles = self._subtitles_filter(subtitle_file, font_size=56, font_color="white")
+        if bg_path is None:
+            def cmd(codec):
+                return [
+                    "ffmpeg", "-y",
+                    *self._rawvideo_input(),
+                    "-vf", f"scale={self.width}:{self.height},{subtitles}",
+                    *codec,
+                    "-pix_fmt", "yuv420p",
+                    str(out_path)
+                ]
+        else:
+            graph = f"[0:v]scale={self.width}:{self.height},split=2[bg][v];[v]{subtitles}[sub]"
+            
+            def cmd(codec):
+                return [
+                    "ffmpeg", "-y",
+                    *self._rawvideo_input(),
+                    "-filter_complex", graph,
+                    "-map", "[sub]", *codec, "-pix_fmt", "yuv420p", str(out_path),
+                    "-map", "[bg]", *codec, "-pix_fmt", "yuv420p", str(bg_path)
+                ]
         
-        # Step 2: Create background
-        print("Creating background video...")
-        background_file = self.create_gradient_background(
-            total_duration,
-            colors,
-            "background.mp4"
-        )
+        try:
+            return self._encode(cmd, frames=lambda: self._gradient_frames(colors, duration, start_time))
+        except subprocess.CalledProcessError as e:
+            print(f"Error rendering lyric video: {e.stderr.decode()}")
+            raise
+    
+    def _concat_segments(self, segments: List[Path], out_path: Path, reencode: bool = False):
+        """
+        Join segments with the concat demuxer
         
-        # Step 3: Add lyrics
-        print("Adding lyrics to video...")
-        final_video = self.add_lyrics_to_video(
-            background_file,
-            subtitle_file,
-            output_file,
-            font_size=56,
-            font_color="white"
-        )
+        Same-codec segments are stream-copied; with reencode (mixed codecs
+        after a hardware fallback) the joined stream is encoded once more.
+        The list file is written next to the segments.
+        """
+        list_file = segments[0].parent / f"{out_path.stem}_concat.txt"
+        list_file.write_text("".join(f"file '{seg.absolute()}'\n" for seg in segments))
+        
+        def cmd(codec):
+            output = [*codec, "-pix_fmt", "yuv420p"] if reencode else ["-c", "copy"]
+            return [
+                "ffmpeg", "-y",
+                "-f", "concat", "-safe", "0",
+                "-i", str(list_file),
+                *output,
+                str(out_path)
+            ]
         
-        print(f"Video created: {final_video}")
-        return final_video
+        try:
+            if reencode:
+                self._encode(cmd)
+            else:
+                self._run_ffmpeg(cmd([]))
+        except subprocess.CalledProcessError as e:
+            print(f"Error joining segments: {e.stderr.decode()}")
+            raise
     
     def create_simple_lyric_card(
         self,
@@ -271,31 +565,22 @@ class VideoAssembler:
         # Create text file for drawtext filter
         text = "\\n".join(lyrics)
         
-        # Genre colors
-        color_schemes = {
-            "lo-fi": "#8B5CF6",
-            "edm": "#3B82F6",
-            "pop": "#EC4899",
-            "classical": "#4B5563",
-            "jazz": "#B45309",
-            "ambient": "#334155"
-        }
-        
-        bg_color = color_schemes.get(genre.lower(), "#8B5CF6")
+        bg_color = self.CARD_COLOR_SCHEMES.get(genre.lower(), "#8B5CF6")
         
         # FFmpeg command with drawtext
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "lavfi",
-            "-i", f"color=c={bg_color}:s={self.width}x{self.height}:d={duration}:r={self.fps}",
-            "-vf", f"drawtext=text='{text}':fontcolor=white:fontsize=48:x=(w-text_w)/2:y=(h-text_h)/2",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
-            str(filepath)
-        ]
+        def cmd(codec):
+            return [
+                "ffmpeg", "-y",
+                "-f", "lavfi",
+                "-i", f"color=c={bg_color}:s={self.width}x{self.height}:d={duration}:r={self.fps}",
+                "-vf", f"drawtext=text='{text}':fontcolor=white:fontsize=48:x=(w-text_w)/2:y=(h-text_h)/2",
+                *codec,
+                "-pix_fmt", "yuv420p",
+                str(filepath)
+            ]
         
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
+            self._encode(cmd, x264_preset="ultrafast")
             return str(filepath)
         except subprocess.CalledProcessError as e:
             print(f"Error creating lyric card: {e.stderr.decode()}")
@@ -306,7 +591,7 @@ class VideoAssembler:
 def create_video_from_lyrics(
     lyrics: List[str],
     genre: str = "lo-fi",
-    output_file: str = "screen_to_song.mp4"
+    output_file: Optional[str] = None
 ) -> str:
     """
     Convenience function to create video from lyrics
@@ -314,13 +599,23 @@ def create_video_from_lyrics(
     Args:
         lyrics: List of lyric lines
         genre: Music genre
-        output_file: Output filename
+        output_file: Output filename (default: content-addressed
+            s2s_<hash>.mp4, reused if the same lyrics + genre were rendered before)
     
     Returns:
         Path to created video
     """
     assembler = VideoAssembler()
     
+    cached_name = None
+    if output_file is None:
+        key = hashlib.blake2b(("\n".join(lyrics) + "|" + genre).encode(), digest_size=8).hexdigest()
+        cached_name = f"s2s_{key}.mp4"
+        cached_path = assembler.output_dir / cached_name
+        if cached_path.exists():
+            print(f"Reusing cached video: {cached_path}")
+            return str(cached_path)
+    
     if not assembler.check_ffmpeg():
         print("Warning: FFmpeg not found. Please install FFmpeg to create videos.")
         print("Returning metadata only.")
@@ -330,7 +625,14 @@ def create_video_from_lyrics(
             "duration": len(lyrics) * 5.0
         })
     
-    return assembler.create_lyric_video(lyrics, genre=genre, output_file=output_file)
+    if cached_name is None:
+        return assembler.create_lyric_video(lyrics, genre=genre, output_file=output_file)
+    
+    # Render under a temp name so an interrupted run never looks like a cache hit
+    tmp_path = assembler.create_lyric_video(lyrics, genre=genre, output_file=f"{Path(cached_name).stem}.tmp.mp4")
+    final_path = assembler.output_dir / cached_name
+    os.replace(tmp_path, final_path)
+    return str(final_path)
 
 
 if __name__ == "__main__":